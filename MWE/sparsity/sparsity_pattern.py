@@ -2,103 +2,30 @@ import numpy as np
 import matplotlib.pyplot as plt
 from firedrake import *
 from firedrake.petsc import PETSc
+from porousdrake.post_processing.plot_sparsity import plot_sparse_matrix
+
+my_cmap = plt.cm.magma
+my_cmap.set_bad(color="lightgray")
 
 
 def plot_matrix(A, **kwargs):
     """Provides a plot of a matrix."""
-    fig, ax = plt.subplots(1, 1)
-
-    petsc_mat = A.M.handle
-
-    size = petsc_mat.getSize()
-    Mij = PETSc.Mat()
-    petsc_mat.convert("aij", Mij)
-
-    n, m = size
-    Mnp = np.array(Mij.getValues(range(n), range(m)))
-    Am = np.ma.masked_values(Mnp, 0, rtol=1e-13)
-
-    my_cmap = plt.cm.magma
-    my_cmap.set_bad(color="lightgray")
-
-    # Plot the matrix
-    plot = ax.matshow(Am, cmap=my_cmap, **kwargs)
-
-    # Remove axis ticks and values
-    ax.tick_params(length=0)
-    ax.set_xticklabels([])
-    ax.set_yticklabels([])
-
-    return plot
+    return plot_sparse_matrix(A.M.handle, cmap=my_cmap, **kwargs)
 
 
 def plot_matrix_mixed(A, **kwargs):
     """Provides a plot of a mixed matrix."""
-    fig, ax = plt.subplots(1, 1)
-
-    petsc_mat = A.M.handle
-
-    total_size = petsc_mat.getSize()
     f0_size = A.M[0, 0].handle.getSize()
-    Mij = PETSc.Mat()
-    petsc_mat.convert("aij", Mij)
-
-    n, m = total_size
-    Mnp = np.array(Mij.getValues(range(n), range(m)))
-    Am = np.ma.masked_values(Mnp, 0, rtol=1e-13)
-
-    my_cmap = plt.cm.magma
-    my_cmap.set_bad(color="lightgray")
-
-    # Plot the matrix
-    plot = ax.matshow(Am, cmap=my_cmap, **kwargs)
-
-    # Remove axis ticks and values
-    ax.tick_params(length=0)
-    ax.set_xticklabels([])
-    ax.set_yticklabels([])
-
-    ax.axhline(y=f0_size[0] - 0.5, color="k")
-    ax.axvline(x=f0_size[0] - 0.5, color="k")
-
-    return plot
+    return plot_sparse_matrix(A.M.handle, block_sizes=[f0_size[0]], cmap=my_cmap, **kwargs)
 
 
 def plot_matrix_hybrid(A, **kwargs):
     """Provides a plot of a hybrid-mixed matrix."""
-    fig, ax = plt.subplots(1, 1)
-
-    petsc_mat = A.M.handle
-
-    total_size = petsc_mat.getSize()
     f0_size = A.M[0, 0].handle.getSize()
     f1_size = A.M[1, 1].handle.getSize()
-
-    Mij = PETSc.Mat()
-    petsc_mat.convert("aij", Mij)
-
-    n, m = total_size
-    Mnp = np.array(Mij.getValues(range(n), range(m)))
-    Am = np.ma.masked_values(Mnp, 0, rtol=1e-13)
-
-    my_cmap = plt.cm.magma
-    my_cmap.set_bad(color="lightgray")
-
-    # Plot the matrix
-    plot = ax.matshow(Am, cmap=my_cmap, **kwargs)
-    # plot = plt.spy(Am, **kwargs)
-
-    # Remove axis ticks and values
-    ax.tick_params(length=0)
-    ax.set_xticklabels([])
-    ax.set_yticklabels([])
-
-    ax.axhline(y=f0_size[0] - 0.5, color="k")
-    ax.axvline(x=f0_size[0] - 0.5, color="k")
-    ax.axhline(y=f0_size[0] + f1_size[0] - 0.5, color="k")
-    ax.axvline(x=f0_size[0] + f1_size[0] - 0.5, color="k")
-
-    return plot
+    return plot_sparse_matrix(
+        A.M.handle, block_sizes=[f0_size[0], f1_size[0]], cmap=my_cmap, **kwargs
+    )
 
 
 N = 5
@@ -1,18 +1,14 @@
 from firedrake import *
 from firedrake.petsc import PETSc
 from firedrake import COMM_WORLD
+import gc
 import numpy as np
-from scipy.stats import linregress
 import os
 import porousdrake.DPP.convergence.exact_solution as sol
-
-try:
-    import matplotlib.pyplot as plt
-
-    plt.rcParams["contour.corner_mask"] = False
-    plt.close("all")
-except:
-    warning("Matplotlib not imported")
+from porousdrake.DPP.convergence.solvers import DPPSolver, cgls, dgls, sdhm
+from porousdrake import profiling
+from porousdrake.post_processing.plotting import pyplot
+from porousdrake.post_processing.results_store import ResultsStore, parameters_hash
 
 
 def compute_error(computed_sol, analytical_sol, var_name, norm_type="L2"):
@@ -27,6 +23,110 @@ def compute_error(computed_sol, analytical_sol, var_name, norm_type="L2"):
     return error_dictionary
 
 
+def compute_errors(fields, norm_types=("L2",)):
+    """Compute the error norms of several fields in a single assembly pass.
+
+    The fields dictionary maps each field name to a (computed, analytical) pair. The norm types
+    are either a sequence applied to every field or a dictionary of sequences per field name.
+    Available norms: "L2", "H1" (cellwise gradients, which is the broken H1 norm for DG fields),
+    "Hdiv" (L2 and divergence) and "Hdiv_semi" (divergence only) for vector fields. Returns a
+    {field name: {norm type: error}} dictionary.
+    """
+    if not fields:
+        raise ValueError("At least one field is required to compute errors")
+
+    # Each requested norm is tested against one component of a Real vector space, so a single
+    # assembly returns all the squared errors at once
+    labels = []
+    integrands = []
+    mesh = None
+    for var_name, (computed_sol, analytical_sol) in fields.items():
+        if mesh is None:
+            mesh = computed_sol.ufl_domain()
+        if isinstance(norm_types, dict):
+            field_norm_types = norm_types[var_name]
+        else:
+            field_norm_types = norm_types
+        error = computed_sol - analytical_sol
+        for norm_type in field_norm_types:
+            labels.append((var_name, norm_type))
+            integrands.append(_squared_error_integrand(error, norm_type))
+
+    errors = {var_name: {} for var_name in fields}
+    if not integrands:
+        return errors
+    R = VectorFunctionSpace(mesh, "R", 0, dim=len(integrands))
+    r = TestFunction(R)
+    with profiling.event("error evaluation"):
+        squared_errors = assemble(
+            sum(integrand * r[i] for i, integrand in enumerate(integrands)) * dx
+        ).dat.data_ro
+
+    for (var_name, norm_type), squared_error in zip(labels, squared_errors):
+        errors[var_name][norm_type] = np.sqrt(max(squared_error, 0.0))
+
+    return errors
+
+
+def _squared_error_integrand(error, norm_type):
+    if norm_type == "L2":
+        return inner(error, error)
+    elif norm_type == "H1":
+        return inner(error, error) + inner(grad(error), grad(error))
+    elif norm_type == "Hdiv":
+        return inner(error, error) + div(error) * div(error)
+    elif norm_type == "Hdiv_semi":
+        return div(error) * div(error)
+    else:
+        raise ValueError("Unknown norm type: %s" % norm_type)
+
+
+def solver_method(solver, monolithic=False):
+    """DPPSolver method of a DPP solver, given as the sdhm, dgls or cgls function or by name.
+
+    The cases are run through DPPSolver to keep track of their costs, so other solvers are
+    rejected. With monolithic, the sdhm traces of both porosities are condensed in one system.
+    """
+    solver_names = {sdhm: "sdhm", dgls: "dgls", cgls: "cgls"}
+    if isinstance(solver, str):
+        method = solver
+    else:
+        method = solver_names.get(solver)
+    if method not in solver_names.values():
+        raise ValueError("Unknown DPP solver %r, use sdhm, dgls or cgls" % (solver,))
+    if monolithic:
+        if method != "sdhm":
+            raise ValueError("The monolithic mode is only available for sdhm")
+        method = "sdhm_monolithic"
+    return method
+
+
+# Columns of the results stores written by convergence_hp
+results_columns = [
+    "timestamp",
+    "case_hash",
+    "case",
+    "method",
+    "degree",
+    "n",
+    "num_cells",
+    "num_dofs",
+    "setup_time",
+    "assembly_time",
+    "solve_time",
+    "ksp_iterations",
+    "rss_growth",
+    "p1_error",
+    "p2_error",
+    "v1_error",
+    "v2_error",
+    "p1_rate",
+    "p2_rate",
+    "v1_rate",
+    "v2_rate",
+]
+
+
 def convergence_hp(
     solver,
     min_degree=1,
@@ -35,11 +135,22 @@ def convergence_hp(
     norm_type="L2",
     quadrilateral=True,
     name="",
+    comm=COMM_WORLD,
+    resume=True,
+    monolithic=False,
     **kwargs
 ):
+    # scipy is only needed for the slopes, so it is not loaded with the module
+    from scipy.stats import linregress
+
+    method = solver_method(solver, monolithic=monolithic)
+    case = name
     if name:
         name += "_"
     for degree in range(min_degree, max_degree):
+        results_store = ResultsStore(
+            "results_%s/results_degree%d.csv" % (name, degree), results_columns, comm=comm
+        )
         p1_errors = np.array([])
         p2_errors = np.array([])
         v1_errors = np.array([])
@@ -47,23 +158,74 @@ def convergence_hp(
         num_cells = np.array([])
         mesh_size = np.array([])
         for n in numel_xy:
+            mesh_size = np.append(mesh_size, 1.0 / n)
+
+            # Cases already recorded with the same parameters are not solved again
+            case_hash = parameters_hash(
+                method=method,
+                degree=degree,
+                n=n,
+                quadrilateral=quadrilateral,
+                norm_type=norm_type,
+                **kwargs
+            )
+            completed_case = results_store.find(case_hash=case_hash) if resume else None
+            if completed_case is not None:
+                PETSc.Sys.Print(
+                    "Skipping completed case: %s (degree %d, n = %d)" % (case, degree, n),
+                    comm=comm,
+                )
+                num_cells = np.append(num_cells, float(completed_case["num_cells"]))
+                p1_errors = np.append(p1_errors, float(completed_case["p1_error"]))
+                p2_errors = np.append(p2_errors, float(completed_case["p2_error"]))
+                v1_errors = np.append(v1_errors, float(completed_case["v1_error"]))
+                v2_errors = np.append(v2_errors, float(completed_case["v2_error"]))
+                continue
+
+            # Memory used by the case, the previous cases being freed
+            rss_before = profiling.resident_memory(comm)
             nel_x = nel_y = n
-            mesh = UnitSquareMesh(nel_x, nel_y, quadrilateral=quadrilateral)
+            mesh = UnitSquareMesh(nel_x, nel_y, quadrilateral=quadrilateral, comm=comm)
             num_cells = np.append(num_cells, mesh.num_cells())
-            mesh_size = np.append(mesh_size, 1.0 / n)
 
-            p1_sol, v1_sol, p2_sol, v2_sol, p_e_1, v_e_1, p_e_2, v_e_2 = solver(
-                mesh=mesh, degree=degree, **kwargs
+            dpp_solver = DPPSolver(method, mesh, degree, profile=True, **kwargs)
+            dpp_solver.solve()
+            errors = dpp_solver.compute_errors(
+                norm_types={"p1": [norm_type], "p2": [norm_type], "v1": ["L2"], "v2": ["L2"]}
             )
-            error_dictionary = {}
-            error_dictionary.update(compute_error(p1_sol, p_e_1, "p1_error", norm_type=norm_type))
-            error_dictionary.update(compute_error(p2_sol, p_e_2, "p2_error", norm_type=norm_type))
-            p1_errors = np.append(p1_errors, error_dictionary["p1_error"])
-            p2_errors = np.append(p2_errors, error_dictionary["p2_error"])
-            error_dictionary.update(compute_error(v1_sol, v_e_1, "v1_error"), norm_type=norm_type)
-            error_dictionary.update(compute_error(v2_sol, v_e_2, "v2_error"), norm_type=norm_type)
-            v1_errors = np.append(v1_errors, error_dictionary["v1_error"])
-            v2_errors = np.append(v2_errors, error_dictionary["v2_error"])
+            p1_errors = np.append(p1_errors, errors["p1"][norm_type])
+            p2_errors = np.append(p2_errors, errors["p2"][norm_type])
+            v1_errors = np.append(v1_errors, errors["v1"]["L2"])
+            v2_errors = np.append(v2_errors, errors["v2"]["L2"])
+            rss_growth = profiling.resident_memory(comm) - rss_before
+
+            # Recording the case, with the convergence rates with respect to the previous mesh
+            results_store.append(
+                case_hash=case_hash,
+                case=case,
+                method=method,
+                degree=degree,
+                n=n,
+                num_cells=mesh.num_cells(),
+                num_dofs=dpp_solver.num_dofs,
+                setup_time=dpp_solver.setup_time,
+                assembly_time=dpp_solver.assembly_time,
+                solve_time=dpp_solver.solve_time,
+                ksp_iterations=dpp_solver.ksp_iterations,
+                rss_growth=rss_growth,
+                p1_error=p1_errors[-1],
+                p2_error=p2_errors[-1],
+                v1_error=v1_errors[-1],
+                v2_error=v2_errors[-1],
+                p1_rate=_convergence_rate(mesh_size, p1_errors),
+                p2_rate=_convergence_rate(mesh_size, p2_errors),
+                v1_rate=_convergence_rate(mesh_size, v1_errors),
+                v2_rate=_convergence_rate(mesh_size, v2_errors),
+            )
+
+            # The exact fields cached on the mesh refer to it, so the collector frees the case
+            del dpp_solver, mesh
+            gc.collect()
         p1_errors_log2 = np.log2(p1_errors)
         p2_errors_log2 = np.log2(p2_errors)
         v1_errors_log2 = np.log2(v1_errors)
@@ -80,6 +242,7 @@ def convergence_hp(
             "\n--------------------------------------\nDegree %d: p1 slope error %f"
             % (degree, np.abs(p1_slope)),
             "\nDegree %d: p2 slope error %f" % (degree, np.abs(p2_slope)),
+            comm=comm,
         )
         v1_slope, intercept_v1, r_value_v1, p_value_v1, stderr_v1 = linregress(
             mesh_size_log2, v1_errors_log2
@@ -91,23 +254,38 @@ def convergence_hp(
             "\n--------------------------------------\nDegree %d: v1 slope error %f"
             % (degree, np.abs(v1_slope)),
             "\nDegree %d: v2 slope error %f" % (degree, np.abs(v2_slope)),
+            comm=comm,
         )
         # _plot_errors(mesh_size, p1_errors, p1_slope, degree, name='p1_errors')
         # _plot_errors(mesh_size, p2_errors, p2_slope, degree, name='p2_errors')
         # _plot_errors(mesh_size, v1_errors, v1_slope, degree, name='v1_errors')
         # _plot_errors(mesh_size, v2_errors, v2_slope, degree, name='v2_errors')
-        os.makedirs("results_%s" % name, exist_ok=True)
-        np.savetxt(
-            ("results_%s/errors_degree%d.dat" % (name, degree)),
-            np.transpose(
-                [-mesh_size_log2, p1_errors_log2, p2_errors_log2, v1_errors_log2, v2_errors_log2]
-            ),
-        )
+        if comm.rank == 0:
+            os.makedirs("results_%s" % name, exist_ok=True)
+            np.savetxt(
+                ("results_%s/errors_degree%d.dat" % (name, degree)),
+                np.transpose(
+                    [
+                        -mesh_size_log2,
+                        p1_errors_log2,
+                        p2_errors_log2,
+                        v1_errors_log2,
+                        v2_errors_log2,
+                    ]
+                ),
+            )
 
     return
 
 
+def _convergence_rate(mesh_size, errors):
+    if len(errors) < 2:
+        return ""
+    return np.log(errors[-2] / errors[-1]) / np.log(mesh_size[-2] / mesh_size[-1])
+
+
 def _plot_errors(mesh_size, errors, slope, degree, name="Error"):
+    plt = pyplot()
     plt.figure()
     plt.loglog(mesh_size, errors, "-o", label=(r"k = %d; slope = %f" % (degree, np.abs(slope))))
     plt.legend(loc="best")
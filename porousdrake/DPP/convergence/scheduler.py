@@ -0,0 +1,141 @@
+"""
+Concurrent scheduling of the DPP convergence cases.
+
+Each (solver, element kind, mesh parameter, degree) combination is an independent task that
+writes its own results_<name>/errors_degree<k>.dat file. The tasks are distributed among MPI
+sub-communicators carved out of COMM_WORLD, so several cases run at the same time.
+"""
+
+from firedrake import COMM_WORLD
+from firedrake.petsc import PETSc
+
+from porousdrake.DPP.convergence import processor
+import porousdrake.setup.solvers_parameters as parameters
+
+
+def case_name(solver_name, mesh_parameter, quadrilateral, options={}):
+    if options.get("monolithic"):
+        solver_name += "_monolithic"
+    if options.get("preconditioner"):
+        solver_name += "_" + options["preconditioner"]
+    if quadrilateral:
+        element_kind = "quad"
+    else:
+        element_kind = "tri"
+    if mesh_parameter:
+        mesh_par = ""
+    else:
+        mesh_par = "meshless_par"
+    return "%s_%s_%s_errors" % (solver_name, mesh_par, element_kind)
+
+
+def build_tasks(
+    solvers_options,
+    mesh_quad=[False, True],
+    mesh_parameters=[True, False],
+    min_degree=1,
+    max_degree=4,
+    preconditioner=None,
+    monolithic=False,
+):
+    tasks = []
+    for element in mesh_quad:
+        for current_solver in solvers_options:
+            options = parameters.solver_options(current_solver, preconditioner, monolithic)
+            for mesh_parameter in mesh_parameters:
+                for degree in range(min_degree, max_degree):
+                    tasks.append(
+                        {
+                            "name": case_name(current_solver, mesh_parameter, element, options),
+                            "solver": current_solver,
+                            "quadrilateral": element,
+                            "mesh_parameter": mesh_parameter,
+                            "degree": degree,
+                            "options": options,
+                        }
+                    )
+    return tasks
+
+
+def distribute_tasks(tasks, num_groups):
+    # Greedy longest-task-first balancing; the cost of a case grows with the number of DoFs per
+    # cell, so the degree is used as the cost estimate
+    groups = [[] for _ in range(num_groups)]
+    loads = [0] * num_groups
+    for task in sorted(tasks, key=lambda task: task["degree"], reverse=True):
+        group = loads.index(min(loads))
+        groups[group].append(task)
+        loads[group] += (task["degree"] + 1) ** 2
+    return groups
+
+
+def run_task(task, solvers_options, numel_xy, comm=COMM_WORLD):
+    PETSc.Sys.Print("*******************************************\n", comm=comm)
+    PETSc.Sys.Print(
+        "*** Begin case: %s (degree %d) ***\n" % (task["name"], task["degree"]), comm=comm
+    )
+
+    # Selecting the solver and its kwargs (copied, since tasks must not share state)
+    solver = solvers_options[task["solver"]]
+    kwargs = dict(parameters.solvers_args[task["solver"]])
+
+    # Stabilizing parameters overridden by the task (e.g. from a case file)
+    kwargs.update(task.get("parameters", {}))
+
+    # Appending the mesh parameter option to kwargs
+    kwargs["mesh_parameter"] = task["mesh_parameter"]
+
+    # Options of the sdhm solvers; the preconditioner is only hashed (with the kwargs) when given
+    options = dict(task.get("options", {}))
+    monolithic = options.pop("monolithic", False)
+    kwargs.update(options)
+
+    # Performing the convergence study for the task degree only
+    processor.convergence_hp(
+        solver,
+        monolithic=monolithic,
+        min_degree=task["degree"],
+        max_degree=task["degree"] + 1,
+        numel_xy=numel_xy,
+        quadrilateral=task["quadrilateral"],
+        name=task["name"],
+        comm=comm,
+        **kwargs
+    )
+    PETSc.Sys.Print(
+        "\n*** End case: %s (degree %d) ***" % (task["name"], task["degree"]), comm=comm
+    )
+    PETSc.Sys.Print("*******************************************\n", comm=comm)
+    return
+
+
+def run_distributed(function, tasks, num_groups=None, comm=COMM_WORLD):
+    """Call function(task, subcomm) for the tasks, distributed among num_groups sub-communicators.
+
+    Every rank of a sub-communicator works on the same list of tasks; returns once all the groups
+    are done.
+    """
+    if num_groups is None:
+        num_groups = comm.size
+    if num_groups < 1 or num_groups > comm.size:
+        raise ValueError(
+            "Number of groups must be between 1 and the communicator size (%d)" % comm.size
+        )
+
+    color = comm.rank % num_groups
+    subcomm = comm.Split(color, comm.rank)
+    for task in distribute_tasks(tasks, num_groups)[color]:
+        function(task, subcomm)
+    comm.Barrier()
+    subcomm.Free()
+    return
+
+
+def run_tasks(tasks, solvers_options, numel_xy, num_groups=None, comm=COMM_WORLD):
+    run_distributed(
+        lambda task, subcomm: run_task(task, solvers_options, numel_xy, comm=subcomm),
+        tasks,
+        num_groups=num_groups,
+        comm=comm,
+    )
+    return
@@ -2,20 +2,13 @@ from firedrake import *
 from porousdrake.DPP.convergence.solvers import dgls, sdhm
 from firedrake.petsc import PETSc
 
-from porousdrake.DPP.convergence import processor
+from porousdrake.DPP.convergence import scheduler
+from porousdrake.post_processing.plotting import pyplot
 import porousdrake.setup.solvers_parameters as parameters
 from porousdrake.post_processing.writers import write_pvd_mixed_formulations
 
 import sys
 
-try:
-    import matplotlib.pyplot as plt
-
-    plt.rcParams["contour.corner_mask"] = False
-    plt.close("all")
-except:
-    warning("Matplotlib not imported")
-
 single_run = False
 nx, ny = 10, 10
 Lx, Ly = 1.0, 1.0
@@ -28,6 +21,9 @@ mesh = RectangleMesh(nx, ny, Lx, Ly, quadrilateral=quadrilateral)
 mesh_quad = [False, True]  # Triangles, Quads
 mesh_parameters = [True, False]
 
+# Number of cases run concurrently (each one on COMM_WORLD.size / num_groups ranks)
+num_groups = COMM_WORLD.size
+
 # Solver options
 solvers_options = {
     #    'cgls_full': cgls,
@@ -53,6 +49,11 @@ solvers_options = {
     "hmvh": sdhm,
 }
 
+# Solver of the condensed traces of the sdhm solvers ("lu", "gamg" or "hypre"; None keeps the
+# default direct solves) and condensation of both porosities in one system
+sdhm_preconditioner = None
+sdhm_monolithic = False
+
 # Choosing the solver
 solver = dgls
 
@@ -62,6 +63,8 @@ n = [5, 10, 15, 20, 25, 30]
 
 # Cold run
 if single_run:
+    plt = pyplot()
+
     p1_sol, v1_sol, p2_sol, v2_sol, p_e_1, v_e_1, p_e_2, v_e_2 = solver(
         mesh=mesh,
         degree=degree,
@@ -91,39 +94,14 @@ if single_run:
 # Sanity check for keys among solvers_options and solvers_args
 assert set(solvers_options.keys()).issubset(parameters.solvers_args.keys())
 
-for element in mesh_quad:
-    for current_solver in solvers_options:
-        for mesh_parameter in mesh_parameters:
-            if element:
-                element_kind = "quad"
-            else:
-                element_kind = "tri"
-            if mesh_parameter:
-                mesh_par = ""
-            else:
-                mesh_par = "meshless_par"
-
-            # Setting the output file name
-            name = "%s_%s_%s_errors" % (current_solver, mesh_par, element_kind)
-            PETSc.Sys.Print("*******************************************\n")
-            PETSc.Sys.Print("*** Begin case: %s ***\n" % name)
-
-            # Selecting the solver and its kwargs
-            solver = solvers_options[current_solver]
-            kwargs = parameters.solvers_args[current_solver]
-
-            # Appending the mesh parameter option to kwargs
-            kwargs["mesh_parameter"] = mesh_parameter
-
-            # Performing the convergence study
-            processor.convergence_hp(
-                solver,
-                min_degree=degree,
-                max_degree=degree + last_degree,
-                numel_xy=n,
-                quadrilateral=quadrilateral,
-                name=name,
-                **kwargs
-            )
-            PETSc.Sys.Print("\n*** End case: %s ***" % name)
-            PETSc.Sys.Print("*******************************************\n")
+# Splitting the sweep in independent cases, which are run concurrently on MPI sub-communicators
+tasks = scheduler.build_tasks(
+    solvers_options,
+    mesh_quad=mesh_quad,
+    mesh_parameters=mesh_parameters,
+    min_degree=degree,
+    max_degree=degree + last_degree,
+    preconditioner=sdhm_preconditioner,
+    monolithic=sdhm_monolithic,
+)
+scheduler.run_tasks(tasks, solvers_options, numel_xy=n, num_groups=num_groups)
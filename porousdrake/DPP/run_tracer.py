@@ -0,0 +1,124 @@
+from firedrake import *
+from firedrake.petsc import PETSc
+
+from porousdrake.DPP.tracer.checkpoint import TracerCheckpoint
+from porousdrake.DPP.tracer.model_parameters import initial_concentration, myk1, myk2
+from porousdrake.DPP.tracer.solvers import TracerSolver
+from porousdrake.post_processing.writers import TransientWriter, transient_to_vtk
+
+nx, ny = 50, 20
+Lx, Ly = 1.0, 0.4
+quadrilateral = True
+degree = 1
+
+# Flow method ("sdhm" or "mdg")
+method = "sdhm"
+
+# Checkpoints are saved every checkpoint_interval seconds of wall time. When a checkpoint exists,
+# the run is resumed from it (possibly on another number of ranks).
+checkpoint_interval = 3600.0
+checkpoint = TracerCheckpoint(
+    "results_tracer_%s/checkpoint.h5" % method, wall_time_interval=checkpoint_interval
+)
+restart = checkpoint.exists()
+if restart:
+    mesh = checkpoint.load_mesh()
+else:
+    mesh = RectangleMesh(nx, ny, Lx, Ly, quadrilateral=quadrilateral)
+
+# Time parameters
+T = 1.5e-3
+dt = 5e-5
+
+# Adaptive time stepping: target Courant number (None keeps dt fixed) and bounds of dt
+cfl = None
+dt_min, dt_max = 1e-7, 1e-3
+
+# Maximum concentration change (max norm) before the flow preconditioner is rebuilt
+precond_tol = 1e-2
+
+# The flow is re-solved every flow_update_interval transport steps, or sooner when the mobility
+# changes by more than mobility_tol (relative, max norm; None disables the check)
+flow_update_interval = 1
+mobility_tol = None
+
+# Permeabilities and initial concentration
+uSpace = FunctionSpace(mesh, "CG", 1)
+kSpace = FunctionSpace(mesh, "DG", 0)
+k1 = interpolate(myk1(mesh, Ly), kSpace)
+k2 = interpolate(myk2(mesh, Ly), kSpace)
+if restart:
+    c_init = checkpoint.load_concentration(mesh)
+else:
+    c_init = initial_concentration(uSpace, Lx)
+
+tracer_solver = TracerSolver(
+    method,
+    mesh,
+    degree,
+    dt,
+    c_init,
+    k1,
+    k2,
+    precond_tol=precond_tol,
+    cfl=cfl,
+    dt_min=dt_min,
+    dt_max=dt_max,
+    flow_update_interval=flow_update_interval,
+    mobility_tol=mobility_tol,
+)
+if restart:
+    checkpoint.restore(tracer_solver)
+    PETSc.Sys.Print(
+        "Resuming from time %g (step %d)" % (tracer_solver.t, tracer_solver.step_number)
+    )
+
+# Output decimation: every write_interval steps and every write_time_interval of simulated time
+# (None to only decimate by steps)
+write_interval = 1
+write_time_interval = None
+# Write the steps to HDF5 from a background thread, converted to VTK at the end of the run
+asynchronous_output = False
+
+writer = TransientWriter(
+    "results_tracer_%s/tracer.pvd" % method,
+    write_interval=write_interval,
+    time_interval=write_time_interval,
+    asynchronous=asynchronous_output,
+    mode="a" if restart else "w",
+)
+
+# Integrating over time
+while tracer_solver.t < T - 1e-12 * T:
+    t = tracer_solver.step(t_end=T)
+    PETSc.Sys.Print("============================")
+    PETSc.Sys.Print("\ttime = %g" % t)
+    PETSc.Sys.Print("============================")
+
+    conc, p1_sol, v1_sol, p2_sol, v2_sol = tracer_solver.fields()
+    v1_sol.rename("Macro velocity", "label")
+    p1_sol.rename("Macro pressure", "label")
+    v2_sol.rename("Micro velocity", "label")
+    p2_sol.rename("Micro pressure", "label")
+    writer.write(conc, v1_sol, p1_sol, v2_sol, p2_sol, time=t, step=tracer_solver.step_number)
+
+    if checkpoint.due():
+        checkpoint.save(tracer_solver)
+writer.close()
+checkpoint.save(tracer_solver)
+if asynchronous_output:
+    conc, p1_sol, v1_sol, p2_sol, v2_sol = tracer_solver.fields()
+    transient_to_vtk(writer.filename, [conc, v1_sol, p1_sol, v2_sol, p2_sol])
+
+PETSc.Sys.Print("total time = %g" % tracer_solver.t)
+PETSc.Sys.Print(
+    "Flow solves: %d, preconditioner builds: %d in %d steps (%d flow, %d transport Krylov "
+    "iterations)"
+    % (
+        tracer_solver.num_flow_solves,
+        tracer_solver.num_preconditioner_updates,
+        tracer_solver.step_number,
+        tracer_solver.flow_iterations,
+        tracer_solver.transport_iterations,
+    )
+)
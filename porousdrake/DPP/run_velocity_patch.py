@@ -5,15 +5,9 @@ import os
 import sys
 
 from porousdrake.DPP.velocity_patch.solvers import cgls, dgls, sdhm
+from porousdrake.post_processing.plotting import pyplot
 import porousdrake.setup.solvers_parameters as parameters
-
-try:
-    import matplotlib.pyplot as plt
-
-    plt.rcParams["contour.corner_mask"] = False
-    plt.close("all")
-except:
-    warning("Matplotlib not imported")
+from porousdrake.setup.permeability import load_permeability
 
 single_evaluation = False
 nx, ny = 50, 30
@@ -22,6 +16,18 @@ quadrilateral = True
 degree = 1
 mesh = RectangleMesh(nx, ny, Lx, Ly, quadrilateral=quadrilateral)
 
+# Heterogeneous permeability maps (.npy files covering the domain). The layered fields from
+# model_parameters are used when they are not provided.
+k1_file = None
+k2_file = None
+permeability_fields = {}
+if k1_file:
+    kSpace = FunctionSpace(mesh, "DG", 0)
+    permeability_fields["k1"] = load_permeability(k1_file, kSpace, ((0.0, Lx), (0.0, Ly)))
+if k2_file:
+    kSpace = FunctionSpace(mesh, "DG", 0)
+    permeability_fields["k2"] = load_permeability(k2_file, kSpace, ((0.0, Lx), (0.0, Ly)))
+
 # Solver options
 solvers_options = {
     "cgls_full": cgls,
@@ -38,10 +44,16 @@ solvers_options = {
     "hmvh": sdhm,
 }
 
+# Solver of the condensed traces of the sdhm solvers ("lu", "gamg" or "hypre"; None keeps the
+# default direct solves) and condensation of both porosities in one system
+sdhm_preconditioner = None
+sdhm_monolithic = False
+
 # Identify discontinuous solvers for writing .pvd purpose
 discontinuous_solvers = ["dgls_full", "dmgls_full", "dmvh_full", "sdhm_full", "hmvh_full", "hmvh"]
 
 if single_evaluation:
+    plt = pyplot()
 
     # Choosing the solver
     solver = cgls
@@ -79,13 +91,14 @@ for current_solver in solvers_options:
 
     # Selecting the solver and its kwargs
     solver = solvers_options[current_solver]
-    kwargs = parameters.solvers_args[current_solver]
+    kwargs = dict(parameters.solvers_args[current_solver])
 
-    # Appending the mesh parameter option to kwargs
+    # Appending the mesh parameter and sdhm options to kwargs
     kwargs["mesh_parameter"] = True
+    kwargs.update(parameters.solver_options(current_solver, sdhm_preconditioner, sdhm_monolithic))
 
     # Running the case
-    current_solution = solver(mesh=mesh, degree=degree, **kwargs)
+    current_solution = solver(mesh=mesh, degree=degree, **permeability_fields, **kwargs)
 
     # Renaming to identify the velocities properly
     current_solution[1].rename("Macro v_x (%s)" % current_solver, "label")
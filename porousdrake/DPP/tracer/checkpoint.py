@@ -0,0 +1,93 @@
+from firedrake import *
+import os
+import time
+
+# Counters and time stepping state of the TracerSolver kept in the checkpoints
+_state_attributes = [
+    "t",
+    "step_number",
+    "num_flow_solves",
+    "steps_since_flow_solve",
+    "num_preconditioner_updates",
+    "flow_iterations",
+    "transport_iterations",
+]
+
+
+class TracerCheckpoint(object):
+    """Checkpoints of a TracerSolver, saved in a Firedrake HDF5 CheckpointFile.
+
+    The mesh is stored with the fields, so a run can be resumed on a different number of ranks
+    by loading the mesh from the checkpoint and building the TracerSolver on it. Each checkpoint
+    is first written to a temporary file, which then replaces the previous checkpoint, so a
+    failure while saving leaves the last complete checkpoint untouched.
+    """
+
+    def __init__(self, filename, wall_time_interval=3600.0, comm=COMM_WORLD):
+        self.filename = filename
+        self.wall_time_interval = wall_time_interval
+        self.comm = comm
+        self.last_save = time.time()
+        self.num_saves = 0
+
+    def exists(self):
+        return self.comm.bcast(os.path.exists(self.filename), root=0)
+
+    def due(self):
+        # Decided on rank 0, since the save is collective
+        elapsed = self.comm.bcast(time.time() - self.last_save, root=0)
+        return elapsed >= self.wall_time_interval
+
+    def save(self, tracer_solver):
+        dirname = os.path.dirname(self.filename)
+        if dirname and self.comm.rank == 0:
+            os.makedirs(dirname, exist_ok=True)
+        tmp_filename = self.filename + ".tmp"
+        with CheckpointFile(tmp_filename, "w", comm=self.comm) as afile:
+            afile.save_mesh(tracer_solver.mesh)
+            afile.save_function(tracer_solver.solution, name="DPP_solution")
+            afile.save_function(tracer_solver.conc_k, name="conc_k")
+            afile.save_function(tracer_solver.conc_flow, name="conc_flow")
+            afile.save_function(tracer_solver.conc_precond, name="conc_precond")
+            afile.set_attr("/tracer", "method", tracer_solver.method)
+            afile.set_attr("/tracer", "dt", float(tracer_solver.dt))
+            for attribute in _state_attributes:
+                afile.set_attr("/tracer", attribute, getattr(tracer_solver, attribute))
+        self.comm.Barrier()
+        if self.comm.rank == 0:
+            os.replace(tmp_filename, self.filename)
+        self.comm.Barrier()
+        self.last_save = time.time()
+        self.num_saves += 1
+
+    def load_mesh(self):
+        with CheckpointFile(self.filename, "r", comm=self.comm) as afile:
+            return afile.load_mesh()
+
+    def load_concentration(self, mesh):
+        with CheckpointFile(self.filename, "r", comm=self.comm) as afile:
+            return afile.load_function(mesh, "conc_k")
+
+    def restore(self, tracer_solver):
+        """Load the fields and the time stepping state into a TracerSolver built on the mesh
+        returned by load_mesh."""
+        with CheckpointFile(self.filename, "r", comm=self.comm) as afile:
+            method = afile.get_attr("/tracer", "method")
+            if method != tracer_solver.method:
+                raise ValueError(
+                    "The checkpoint was saved by the %s method, not %s"
+                    % (method, tracer_solver.method)
+                )
+            mesh = tracer_solver.mesh
+            tracer_solver.solution.assign(afile.load_function(mesh, "DPP_solution"))
+            tracer_solver.conc_k.assign(afile.load_function(mesh, "conc_k"))
+            tracer_solver.conc.assign(tracer_solver.conc_k)
+            tracer_solver.conc_flow.assign(afile.load_function(mesh, "conc_flow"))
+            tracer_solver.conc_precond.assign(afile.load_function(mesh, "conc_precond"))
+            tracer_solver.dt.assign(afile.get_attr("/tracer", "dt"))
+            for attribute in _state_attributes:
+                setattr(tracer_solver, attribute, afile.get_attr("/tracer", attribute))
+
+        # The preconditioner of the new solver is built with the restored concentration
+        tracer_solver.update_preconditioner(force=True)
+        self.last_save = time.time()
@@ -0,0 +1,50 @@
+from firedrake import *
+import numpy as np
+from porousdrake.setup.permeability import layered_permeability
+
+# Viscosity, viscosity-concentration ratio and diffusivity
+mu0, Rc, D = Constant(1e-3), Constant(3.0), Constant(2e-6)
+tol = 1e-14
+
+# Boundary conditions: pressures on the left (1) and right (2) sides, injected concentration
+p_L = Constant(10.0)
+p_R = Constant(1.0)
+c_inj = Constant(1.0)
+
+# Source and gravitational terms
+rhob1, rhob2 = Constant((0.0, 0.0)), Constant((0.0, 0.0))
+f = Constant(0.0)
+
+# Permeability of the bottom and top halves of the domain
+k1_0 = 1.1
+k1_1 = 0.9
+k2_0 = 0.01 * k1_0
+k2_1 = 0.01 * k1_1
+
+
+def myk1(mesh, Ly):
+    return layered_permeability(mesh, [Ly / 2.0 + tol, Ly], [k1_0, k1_1])
+
+
+def myk2(mesh, Ly):
+    return layered_permeability(mesh, [Ly / 2.0 + tol, Ly], [k2_0, k2_1])
+
+
+def alpha(c, k):
+    return mu0 * exp(Rc * (1.0 - c)) / k
+
+
+def invalpha(c, k):
+    return 1.0 / alpha(c, k)
+
+
+def initial_concentration(uSpace, Lx, seed=222):
+    # Small random concentration next to the injection side
+    x = interpolate(SpatialCoordinate(uSpace.mesh()), VectorFunctionSpace(uSpace.mesh(), "CG", 1))
+    c_0 = Function(uSpace, name="Concentration")
+    random_values = np.random.RandomState(seed).random_sample(len(c_0.dat.data_ro))
+    x_values = x.dat.data_ro[:, 0]
+    c_0.dat.data[:] = np.where(
+        x_values < 0.010 * Lx, np.abs(0.1 * np.exp(-x_values * x_values) * random_values), 0.0
+    )
+    return c_0
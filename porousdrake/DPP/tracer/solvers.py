@@ -0,0 +1,413 @@
+from firedrake import *
+import numpy as np
+from firedrake.petsc import PETSc
+from mpi4py import MPI
+from porousdrake.DPP.tracer.model_parameters import *
+
+_sdhm_solver_parameters = {
+    "snes_type": "ksponly",
+    "pmat_type": "matfree",
+    "ksp_type": "lgmres",
+    "ksp_rtol": 1.0e-10,
+    "ksp_atol": 1.0e-10,
+    "pc_type": "fieldsplit",
+    "pc_fieldsplit_0_fields": "0,1,2",
+    "pc_fieldsplit_1_fields": "3,4,5",
+    "fieldsplit_0": {
+        "pmat_type": "matfree",
+        "ksp_type": "preonly",
+        "pc_type": "python",
+        "pc_python_type": "firedrake.SCPC",
+        "pc_sc_eliminate_fields": "0, 1",
+        "condensed_field": {
+            "ksp_type": "preonly",
+            "pc_type": "lu",
+            "pc_factor_mat_solver_type": "mumps",
+        },
+    },
+    "fieldsplit_1": {
+        "pmat_type": "matfree",
+        "ksp_type": "preonly",
+        "pc_type": "python",
+        "pc_python_type": "firedrake.SCPC",
+        "pc_sc_eliminate_fields": "0, 1",
+        "condensed_field": {
+            "ksp_type": "preonly",
+            "pc_type": "lu",
+            "pc_factor_mat_solver_type": "mumps",
+        },
+    },
+}
+
+_mdg_solver_parameters = {
+    "ksp_type": "lgmres",
+    "pc_type": "lu",
+    "mat_type": "aij",
+    "ksp_rtol": 1e-5,
+}
+
+_transport_solver_parameters = {
+    "ksp_type": "gmres",
+    "ksp_rtol": 1e-10,
+    "pc_type": "bjacobi",
+    "sub_pc_type": "ilu",
+}
+
+
+class TracerSolver(object):
+    """Coupled DPP flow and tracer transport, with persistent solvers over the time steps.
+
+    The flow viscosity depends on the lagged concentration conc_k. The flow preconditioner (the
+    LU factors of the operator or of the condensed traces) is only rebuilt when conc_k has changed
+    by more than precond_tol (in max norm) since its last build; otherwise it is reused, lagged,
+    and the Krylov method accounts for the change of the operator.
+
+    The flow and the transport are split: the flow is only re-solved every flow_update_interval
+    transport steps, or as soon as the mobility has changed by more than mobility_tol (relative,
+    in max norm) since the last flow solve. With cfl, the time step is adapted to the Darcy
+    velocity v1 + v2 so that the Courant number is cfl, within [dt_min, dt_max].
+    """
+
+    def __init__(
+        self,
+        method,
+        mesh,
+        degree,
+        dt,
+        c_init,
+        k1,
+        k2,
+        precond_tol=1e-2,
+        cfl=None,
+        dt_min=0.0,
+        dt_max=None,
+        flow_update_interval=1,
+        mobility_tol=None,
+        flow_solver_parameters={},
+        transport_solver_parameters={},
+    ):
+        if method not in _methods:
+            raise ValueError(
+                "Unknown method '%s', available methods are: %s" % (method, ", ".join(_methods))
+            )
+        build_flow, default_solver_parameters = _methods[method]
+        if not flow_solver_parameters:
+            flow_solver_parameters = default_solver_parameters
+        if not transport_solver_parameters:
+            transport_solver_parameters = _transport_solver_parameters
+        self.method = method
+        self.mesh = mesh
+        self.precond_tol = precond_tol
+        self.cfl = cfl
+        self.dt_min = dt_min
+        self.dt_max = dt_max
+        self.flow_update_interval = flow_update_interval
+        self.mobility_tol = mobility_tol
+        self.dt = Constant(dt)
+        self.t = 0.0
+        self.step_number = 0
+
+        # Concentration of the previous step (conc_k), the one being computed (conc), the one
+        # the flow preconditioner was last built with and the one of the last flow solve
+        uSpace = c_init.function_space()
+        self.conc_k = Function(uSpace, name="Concentration").assign(c_init)
+        self.conc = Function(uSpace, name="Concentration").assign(c_init)
+        self.conc_precond = Function(uSpace).assign(c_init)
+        self.conc_flow = Function(uSpace).assign(c_init)
+
+        self.solution, self.flow_solver, self.field_indices = build_flow(
+            mesh, degree, self.conc_k, k1, k2, flow_solver_parameters
+        )
+        v1_index, v2_index = self.field_indices[1], self.field_indices[3]
+        self.velocity = self.solution.sub(v1_index) + self.solution.sub(v2_index)
+        self.transport_solver = _transport_solver(
+            mesh, self.velocity, self.conc, self.conc_k, self.dt, transport_solver_parameters
+        )
+
+        # Cell-wise |v| / h, whose maximum gives the time step of the target Courant number
+        self.courant_rate = Function(FunctionSpace(mesh, "DG", 0))
+        self.courant_rate_expression = sqrt(dot(self.velocity, self.velocity)) / CellDiameter(mesh)
+
+        # The lag is kept over the solves, and reset to rebuild the preconditioner only once
+        self.flow_snes.setLagPreconditionerPersists(True)
+        self.flow_snes.setLagPreconditioner(-2)
+        self.num_preconditioner_updates = 1
+        self.num_flow_solves = 0
+        self.steps_since_flow_solve = 0
+        self.flow_iterations = 0
+        self.transport_iterations = 0
+
+    @property
+    def flow_snes(self):
+        return self.flow_solver.snes
+
+    @property
+    def transport_ksp(self):
+        return self.transport_solver.snes.ksp
+
+    def fields(self):
+        """Concentration and the (p1, v1, p2, v2) flow fields of the current step."""
+        return (self.conc,) + tuple(self.solution.sub(index) for index in self.field_indices)
+
+    def concentration_change(self):
+        conc_change = np.max(
+            np.abs(self.conc_k.dat.data_ro - self.conc_precond.dat.data_ro), initial=0.0
+        )
+        return self.mesh.comm.allreduce(conc_change, op=MPI.MAX)
+
+    def update_preconditioner(self, force=False):
+        # Rebuilding the flow preconditioner at the next solve when the viscosity moved too far
+        # from the one it was built with
+        if force or self.concentration_change() > self.precond_tol:
+            self.flow_snes.setLagPreconditioner(-2)
+            self.conc_precond.assign(self.conc_k)
+            self.num_preconditioner_updates += 1
+            return True
+        return False
+
+    def mobility_change(self):
+        # The mobility is proportional to exp(-Rc * (1 - c)), so its relative change only depends
+        # on the concentration change
+        conc_change = self.conc_k.dat.data_ro - self.conc_flow.dat.data_ro
+        mobility_change = np.max(np.abs(np.expm1(float(Rc) * conc_change)), initial=0.0)
+        return self.mesh.comm.allreduce(mobility_change, op=MPI.MAX)
+
+    def flow_update_required(self):
+        if self.num_flow_solves == 0:
+            return True
+        if self.steps_since_flow_solve >= self.flow_update_interval:
+            return True
+        return self.mobility_tol is not None and self.mobility_change() > self.mobility_tol
+
+    def solve_flow(self):
+        self.update_preconditioner()
+        self.flow_solver.solve()
+        self.flow_iterations += self.flow_snes.ksp.getIterationNumber()
+        self.conc_flow.assign(self.conc_k)
+        self.num_flow_solves += 1
+        self.steps_since_flow_solve = 0
+
+    def solve_transport(self):
+        self.transport_solver.solve()
+        self.transport_iterations += self.transport_ksp.getIterationNumber()
+        self.conc_k.assign(self.conc)
+        self.steps_since_flow_solve += 1
+
+    def stable_time_step(self):
+        """Time step of Courant number cfl for the current Darcy velocity."""
+        self.courant_rate.interpolate(self.courant_rate_expression)
+        max_rate = self.mesh.comm.allreduce(
+            np.max(self.courant_rate.dat.data_ro, initial=0.0), op=MPI.MAX
+        )
+        if max_rate == 0.0:
+            dt = float(self.dt)
+        else:
+            dt = self.cfl / max_rate
+        if self.dt_max is not None:
+            dt = min(dt, self.dt_max)
+        return max(dt, self.dt_min)
+
+    def step(self, t_end=None):
+        if self.flow_update_required():
+            self.solve_flow()
+        if self.cfl is not None:
+            self.dt.assign(self.stable_time_step())
+        if t_end is not None and self.t + float(self.dt) > t_end:
+            self.dt.assign(t_end - self.t)
+        self.t += float(self.dt)
+        self.step_number += 1
+        self.solve_transport()
+        return self.t
+
+
+def _transport_solver(mesh, velocity, conc, conc_k, dt, solver_parameters):
+    # SUPG stabilized advection-diffusion, implicit in time
+    uSpace = conc.function_space()
+    h = CellDiameter(mesh)
+    c1 = TrialFunction(uSpace)
+    u = TestFunction(uSpace)
+
+    vnorm = sqrt(dot(velocity, velocity))
+    taw = h / (2.0 * vnorm) * dot(velocity, grad(u))
+    a_r = taw * (c1 + dt * (dot(velocity, grad(c1)) - div(D * grad(c1)))) * dx
+    L_r = taw * (conc_k + dt * f) * dx
+
+    aAD = (
+        a_r
+        + u * c1 * dx
+        + dt * (u * dot(velocity, grad(c1)) * dx + dot(grad(u), D * grad(c1)) * dx)
+    )
+    LAD = L_r + u * conc_k * dx + dt * u * f * dx
+
+    bcleft_c = DirichletBC(uSpace, c_inj, 1)
+    problem_transport = LinearVariationalProblem(
+        aAD, LAD, conc, bcs=[bcleft_c], constant_jacobian=False
+    )
+    return LinearVariationalSolver(
+        problem_transport, options_prefix="dpp_transport", solver_parameters=solver_parameters
+    )
+
+
+def _sdhm_flow(mesh, degree, conc_k, k1, k2, solver_parameters):
+    pressure_family = "DG"
+    velocity_family = "DG"
+    trace_family = "HDiv Trace"
+    U1 = VectorFunctionSpace(mesh, velocity_family, degree)
+    U2 = VectorFunctionSpace(mesh, velocity_family, degree + 1)
+    V = FunctionSpace(mesh, pressure_family, degree)
+    T = FunctionSpace(mesh, trace_family, degree)
+    W = U1 * V * T * U2 * V * T
+
+    # Trial and test functions
+    DPP_solution = Function(W)
+    u1, p1, lambda1, u2, p2, lambda2 = split(DPP_solution)
+    v1, q1, mu1, v2, q2, mu2 = TestFunctions(W)
+
+    # Mesh entities
+    n = FacetNormal(mesh)
+    h = CellDiameter(mesh)
+
+    # Stabilizing parameter
+    beta_0 = Constant(1.0e-15)
+    beta = beta_0 / h
+    beta_avg = beta_0 / h("+")
+    delta_0 = Constant(1.0)
+    delta_1 = Constant(-0.5)
+    delta_2 = h * h * Constant(0.5)
+    delta_3 = h * h * Constant(0.5)
+
+    alpha1, alpha2 = alpha(conc_k, k1), alpha(conc_k, k2)
+    invalpha1, invalpha2 = invalpha(conc_k, k1), invalpha(conc_k, k2)
+    invalpha1_avg = invalpha(conc_k("+"), k1("+"))
+    invalpha2_avg = invalpha(conc_k("+"), k2("+"))
+
+    # Mixed classical terms
+    a = (dot(alpha1 * u1, v1) - div(v1) * p1 - delta_0 * q1 * div(u1)) * dx
+    a += (dot(alpha2 * u2, v2) - div(v2) * p2 - delta_0 * q2 * div(u2)) * dx
+    a += delta_0 * q1 * (invalpha1 / k1) * (p2 - p1) * dx
+    a += delta_0 * q2 * (invalpha2 / k2) * (p1 - p2) * dx
+    L = -delta_0 * dot(rhob1, v1) * dx
+    L += -delta_0 * dot(rhob2, v2) * dx
+    # Stabilizing terms
+    ###
+    a += (
+        delta_1 * inner(invalpha1 * (alpha1 * u1 + grad(p1)), delta_0 * alpha1 * v1 + grad(q1)) * dx
+    )
+    a += (
+        delta_1 * inner(invalpha2 * (alpha2 * u2 + grad(p2)), delta_0 * alpha2 * v2 + grad(q2)) * dx
+    )
+    ###
+    a += delta_2 * alpha1 * div(u1) * div(v1) * dx
+    a += delta_2 * alpha2 * div(u2) * div(v2) * dx
+    L += delta_2 * alpha1 * (invalpha1 / k1) * (p2 - p1) * div(v1) * dx
+    L += delta_2 * alpha2 * (invalpha2 / k2) * (p1 - p2) * div(v2) * dx
+    ###
+    a += delta_3 * inner(invalpha1 * curl(alpha1 * u1), curl(alpha1 * v1)) * dx
+    a += delta_3 * inner(invalpha2 * curl(alpha2 * u2), curl(alpha2 * v2)) * dx
+    # Hybridization terms
+    ###
+    a += lambda1("+") * jump(v1, n) * dS + mu1("+") * jump(u1, n) * dS
+    a += lambda2("+") * jump(v2, n) * dS + mu2("+") * jump(u2, n) * dS
+    ###
+    a += beta_avg * invalpha1_avg * (lambda1("+") - p1("+")) * (mu1("+") - q1("+")) * dS
+    a += beta_avg * invalpha2_avg * (lambda2("+") - p2("+")) * (mu2("+") - q2("+")) * dS
+    # Weakly imposed BC from hybridization
+    a += (p_L * dot(v1, n) + mu1 * dot(u1, n)) * ds(1)
+    a += (p_L * dot(v2, n) + mu2 * dot(u2, n)) * ds(1)
+    a += (p_R * dot(v1, n) + mu1 * dot(u1, n)) * ds(2)
+    a += (p_R * dot(v2, n) + mu2 * dot(u2, n)) * ds(2)
+    a += (lambda1 * dot(v1, n) + mu1 * dot(u1, n)) * (ds(3) + ds(4))
+    a += (lambda2 * dot(v2, n) + mu2 * dot(u2, n)) * (ds(3) + ds(4))
+    ###
+    a += beta * invalpha1 * lambda1 * mu1 * (ds(3) + ds(4))
+    a += beta * invalpha2 * lambda2 * mu2 * (ds(3) + ds(4))
+    a += beta * invalpha1 * (lambda1 - p_L) * mu1 * ds(1)
+    a += beta * invalpha2 * (lambda2 - p_L) * mu2 * ds(1)
+    a += beta * invalpha1 * (lambda1 - p_R) * mu1 * ds(2)
+    a += beta * invalpha2 * (lambda2 - p_R) * mu2 * ds(2)
+
+    F = a - L
+
+    #  Solving SC below
+    problem_flow = NonlinearVariationalProblem(F, DPP_solution)
+    solver_flow = NonlinearVariationalSolver(
+        problem_flow, options_prefix="dpp_flow", solver_parameters=solver_parameters
+    )
+    return DPP_solution, solver_flow, (1, 0, 4, 3)
+
+
+def _mdg_flow(mesh, degree, conc_k, k1, k2, solver_parameters):
+    velSpace = VectorFunctionSpace(mesh, "DG", degree)
+    pSpace = FunctionSpace(mesh, "DG", degree)
+    wSpace = MixedFunctionSpace([velSpace, pSpace, velSpace, pSpace])
+
+    # Trial and test functions
+    v1, p1, v2, p2 = TrialFunctions(wSpace)
+    w1, q1, w2, q2 = TestFunctions(wSpace)
+    DPP_solution = Function(wSpace)
+
+    # Mesh entities
+    n = FacetNormal(mesh)
+    h = CellDiameter(mesh)
+    h_avg = (h("+") + h("-")) / 2.0
+
+    eta_p, eta_u = Constant(0.0), Constant(0.0)
+
+    alpha1, alpha2 = alpha(conc_k, k1), alpha(conc_k, k2)
+    invalpha1, invalpha2 = invalpha(conc_k, k1), invalpha(conc_k, k2)
+
+    aDPP = (
+        dot(w1, alpha1 * v1) * dx
+        + dot(w2, alpha2 * v2) * dx
+        - div(w1) * p1 * dx
+        - div(w2) * p2 * dx
+        + q1 * div(v1) * dx
+        + q2 * div(v2) * dx
+        + q1 * (invalpha1 / k1) * (p1 - p2) * dx
+        - q2 * (invalpha2 / k2) * (p1 - p2) * dx
+        + jump(w1, n) * avg(p1) * dS
+        + jump(w2, n) * avg(p2) * dS
+        - avg(q1) * jump(v1, n) * dS
+        - avg(q2) * jump(v2, n) * dS
+        + dot(w1, n) * p1 * ds(3)
+        + dot(w2, n) * p2 * ds(3)
+        - q1 * dot(v1, n) * ds(3)
+        - q2 * dot(v2, n) * ds(3)
+        + dot(w1, n) * p1 * ds(4)
+        + dot(w2, n) * p2 * ds(4)
+        - q1 * dot(v1, n) * ds(4)
+        - q2 * dot(v2, n) * ds(4)
+        - 0.5 * dot(alpha1 * w1 - grad(q1), invalpha1 * (alpha1 * v1 + grad(p1))) * dx
+        - 0.5 * dot(alpha2 * w2 - grad(q2), invalpha2 * (alpha2 * v2 + grad(p2))) * dx
+        + (eta_u * h_avg) * avg(alpha1) * (jump(v1, n) * jump(w1, n)) * dS
+        + (eta_u * h_avg) * avg(alpha2) * (jump(v2, n) * jump(w2, n)) * dS
+        + (eta_p / h_avg) * avg(1.0 / alpha1) * dot(jump(q1, n), jump(p1, n)) * dS
+        + (eta_p / h_avg) * avg(1.0 / alpha2) * dot(jump(q2, n), jump(p2, n)) * dS
+    )
+
+    LDPP = (
+        dot(w1, rhob1) * dx
+        + dot(w2, rhob2) * dx
+        - dot(w1, n) * p_L * ds(1)
+        - dot(w2, n) * p_L * ds(1)
+        - dot(w1, n) * p_R * ds(2)
+        - dot(w2, n) * p_R * ds(2)
+        - 0.5 * dot(alpha1 * w1 - grad(q1), invalpha1 * rhob1) * dx
+        - 0.5 * dot(alpha2 * w2 - grad(q2), invalpha2 * rhob2) * dx
+    )
+
+    # Solving
+    problem_flow = LinearVariationalProblem(
+        aDPP, LDPP, DPP_solution, bcs=[], constant_jacobian=False
+    )
+    solver_flow = LinearVariationalSolver(
+        problem_flow, options_prefix="dpp_flow", solver_parameters=solver_parameters
+    )
+    return DPP_solution, solver_flow, (1, 0, 3, 2)
+
+
+# Flow solver builder and default solver parameters of each method
+_methods = {
+    "sdhm": (_sdhm_flow, _sdhm_solver_parameters),
+    "mdg": (_mdg_flow, _mdg_solver_parameters),
+}
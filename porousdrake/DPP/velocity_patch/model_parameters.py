@@ -1,4 +1,5 @@
 from firedrake import *
+from porousdrake.setup.permeability import layered_permeability
 
 # kSpace = FunctionSpace(mesh, "DG", 0)
 
@@ -9,29 +10,13 @@ rhob1, rhob2 = Constant((0.0, 0.0)), Constant((0.0, 0.0))
 tol = 1e-14
 
 
-class myk1(Expression):
-    def eval(self, values, x):
-        if x[1] <= 0.8:
-            values[0] = 80 * k
-        elif x[1] <= 1.6:
-            values[0] = 30 * k
-        elif x[1] <= 2.4:
-            values[0] = 5 * k
-        elif x[1] <= 3.2:
-            values[0] = 50 * k
-        elif x[1] <= 4.0:
-            values[0] = 10 * k
-
-
-class myk2(Expression):
-    def eval(self, values, x):
-        if x[1] <= 0.8:
-            values[0] = 16 * k
-        elif x[1] <= 1.6:
-            values[0] = 6 * k
-        elif x[1] <= 2.4:
-            values[0] = 1 * k
-        elif x[1] <= 3.2:
-            values[0] = 10 * k
-        elif x[1] <= 4.0:
-            values[0] = 2 * k
+# Top of each layer along the y direction
+layers_top = [0.8, 1.6, 2.4, 3.2, 4.0]
+
+
+def myk1(mesh):
+    return layered_permeability(mesh, layers_top, [80 * k, 30 * k, 5 * k, 50 * k, 10 * k])
+
+
+def myk2(mesh):
+    return layered_permeability(mesh, layers_top, [16 * k, 6 * k, 1 * k, 10 * k, 2 * k])
@@ -2,18 +2,10 @@ from firedrake import *
 from firedrake.petsc import PETSc
 from firedrake import COMM_WORLD
 import numpy as np
-from scipy.stats import linregress
 import os
+from porousdrake.post_processing.plotting import pyplot
 import porousdrake.SPP.convergence.exact_solution as sol
 
-try:
-    import matplotlib.pyplot as plt
-
-    plt.rcParams["contour.corner_mask"] = False
-    plt.close("all")
-except:
-    warning("Matplotlib not imported")
-
 
 def compute_error(computed_sol, analytical_sol, var_name, norm_type="L2"):
     # Now we compute the various metrics. First we
@@ -37,6 +29,9 @@ def convergence_hp(
     name="",
     **kwargs
 ):
+    # scipy is only needed for the slopes, so it is not loaded with the module
+    from scipy.stats import linregress
+
     for degree in range(min_degree, max_degree):
         p_errors = np.array([])
         v_errors = np.array([])
@@ -84,6 +79,7 @@ def convergence_hp(
 
 
 def _plot_errors(mesh_size, errors, slope, degree, name="Error"):
+    plt = pyplot()
     plt.figure()
     plt.loglog(mesh_size, errors, "-o", label=(r"k = %d; slope = %f" % (degree, np.abs(slope))))
     plt.legend(loc="best")
@@ -4,19 +4,12 @@ from firedrake import COMM_WORLD
 
 from porousdrake.SPP.convergence import processor
 from porousdrake.SPP.convergence.solvers import cgls, dgls, sdhm
+from porousdrake.post_processing.plotting import pyplot
 from porousdrake.setup import solvers_parameters as parameters
 
 # import postprocessing as pp
 import sys
 
-try:
-    import matplotlib.pyplot as plt
-
-    plt.rcParams["contour.corner_mask"] = False
-    plt.close("all")
-except:
-    warning("Matplotlib not imported")
-
 single_run = False
 nx, ny = 10, 10
 Lx, Ly = 1.0, 1.0
@@ -63,6 +56,8 @@ n = [5, 10, 15, 20, 25, 30]
 
 # Cold run
 if single_run:
+    plt = pyplot()
+
     p_sol, v_sol, p_e, v_e = solver(
         mesh=mesh,
         degree=degree,
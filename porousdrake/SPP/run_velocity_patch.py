@@ -5,16 +5,9 @@ import os
 import sys
 
 from porousdrake.SPP.velocity_patch.solvers import cgls, dgls, sdhm
+from porousdrake.post_processing.plotting import pyplot
 import porousdrake.setup.solvers_parameters as parameters
 
-try:
-    import matplotlib.pyplot as plt
-
-    plt.rcParams["contour.corner_mask"] = False
-    plt.close("all")
-except:
-    warning("Matplotlib not imported")
-
 single_evaluation = False
 nx, ny = 50, 30
 Lx, Ly = 5.0, 4.0
@@ -42,6 +35,7 @@ solvers_options = {
 discontinuous_solvers = ["dgls_full", "dmgls_full", "dmvh_full", "sdhm_full", "hmvh_full", "hmvh"]
 
 if single_evaluation:
+    plt = pyplot()
 
     # Choosing the solver
     solver = sdhm
@@ -1,4 +1,5 @@
 from firedrake import *
+from porousdrake.setup.permeability import layered_permeability
 
 # kSpace = FunctionSpace(mesh, "DG", 0)
 
@@ -9,15 +10,11 @@ f = Constant(0.0)
 tol = 1e-14
 
 
-class myk(Expression):
-    def eval(self, values, x):
-        if x[1] <= 0.8:
-            values[0] = 80 * k_ref
-        elif x[1] <= 1.6:
-            values[0] = 30 * k_ref
-        elif x[1] <= 2.4:
-            values[0] = 5 * k_ref
-        elif x[1] <= 3.2:
-            values[0] = 50 * k_ref
-        elif x[1] <= 4.0:
-            values[0] = 10 * k_ref
+# Top of each layer along the y direction
+layers_top = [0.8, 1.6, 2.4, 3.2, 4.0]
+
+
+def myk(mesh):
+    return layered_permeability(
+        mesh, layers_top, [80 * k_ref, 30 * k_ref, 5 * k_ref, 50 * k_ref, 10 * k_ref]
+    )
@@ -3,14 +3,8 @@ import numpy as np
 from firedrake.petsc import PETSc
 from firedrake import COMM_WORLD
 from porousdrake.SPP.velocity_patch.model_parameters import *
-
-try:
-    import matplotlib.pyplot as plt
-
-    plt.rcParams["contour.corner_mask"] = False
-    plt.close("all")
-except:
-    warning("Matplotlib not imported")
+from porousdrake import formulations
+import porousdrake.setup.solvers_parameters as parameters
 
 
 def sdhm(
@@ -25,97 +19,25 @@ def sdhm(
     solver_parameters={},
 ):
     if not solver_parameters:
-        solver_parameters = {
-            "snes_type": "ksponly",
-            "mat_type": "matfree",
-            "pmat_type": "matfree",
-            "ksp_type": "preonly",
-            "pc_type": "python",
-            # Use the static condensation PC for hybridized problems
-            # and use a direct solve on the reduced system for lambda_h
-            "pc_python_type": "firedrake.SCPC",
-            "pc_sc_eliminate_fields": "0, 1",
-            "condensed_field": {
-                "ksp_type": "preonly",
-                "pc_type": "lu",
-                "pc_factor_mat_solver_type": "mumps",
-            },
-        }
-
-    pressure_family = "DG"
-    velocity_family = "DG"
-    trace_family = "HDiv Trace"
-    U = VectorFunctionSpace(mesh, velocity_family, degree)
-    V = FunctionSpace(mesh, pressure_family, degree)
-    T = FunctionSpace(mesh, trace_family, degree)
-    W = U * V * T
-
-    # Trial and test functions
-    DPP_solution = Function(W)
-    u, p, lambda_h = split(DPP_solution)
-    v, q, mu_h = TestFunctions(W)
-
-    # Mesh entities
-    n = FacetNormal(mesh)
-    h = CellDiameter(mesh)
-    x, y = SpatialCoordinate(mesh)
-
-    # Permeability
-    k = conditional(
-        y <= 0.8,
-        80 * k_ref,
-        conditional(
-            y <= 1.6,
-            30 * k_ref,
-            conditional(y <= 2.4, 5 * k_ref, conditional(y <= 3.2, 50 * k_ref, 10 * k_ref)),
-        ),
+        solver_parameters = parameters.spp_sdhm_solver_parameters
+
+    DPP_solution, problem_flow = formulations.build_problem(
+        "sdhm",
+        mesh,
+        degree,
+        _porosity(mesh),
+        mesh_parameter=mesh_parameter,
+        beta_0=beta_0,
+        delta_0=delta_0,
+        delta_1=delta_1,
+        delta_2=delta_2,
+        delta_3=delta_3,
     )
 
-    def alpha():
-        return mu / k
-
-    def invalpha():
-        return 1.0 / alpha()
-
-    # Flux BCs
-    un_1 = -k / mu
-    un_2 = k / mu
-
-    # Stabilizing parameter
-    beta = beta_0 / h
-    beta_avg = beta_0 / h("+")
-    if mesh_parameter:
-        delta_2 = delta_2 * h * h
-        delta_3 = delta_3 * h * h
-
-    # Mixed classical terms
-    a = (dot(alpha() * u, v) - div(v) * p - delta_0 * q * div(u)) * dx
-    L = -delta_0 * f * q * dx - delta_0 * dot(rhob, v) * dx
-    # Stabilizing terms
-    ###
-    a += delta_1 * inner(invalpha() * (alpha() * u + grad(p)), delta_0 * alpha() * v + grad(q)) * dx
-    ###
-    a += delta_2 * alpha() * div(u) * div(v) * dx
-    L += delta_2 * alpha() * f * div(v) * dx
-    ###
-    a += delta_3 * inner(invalpha() * curl(alpha() * u), curl(alpha() * v)) * dx
-    # Hybridization terms
-    ###
-    a += lambda_h("+") * jump(v, n) * dS + mu_h("+") * jump(u, n) * dS
-    ###
-    a += beta_avg * invalpha()("+") * (lambda_h("+") - p("+")) * (mu_h("+") - q("+")) * dS
-    # Weakly imposed BC from hybridization
-    a += (lambda_h * dot(v, n) + mu_h * (dot(u, n) - un_1)) * ds(1)
-    a += (lambda_h * dot(v, n) + mu_h * (dot(u, n) - un_2)) * ds(2)
-    a += (lambda_h * dot(v, n) + mu_h * (dot(u, n))) * (ds(3) + ds(4))
-
-    F = a - L
-
     #  Solving SC below
     PETSc.Sys.Print(
         "*******************************************\nSolving using static condensation.\n"
     )
-    problem_flow = NonlinearVariationalProblem(F, DPP_solution)
     solver_flow = NonlinearVariationalSolver(problem_flow, solver_parameters=solver_parameters)
     solver_flow.solve()
 
@@ -146,78 +68,21 @@ def dgls(
             "ksp_monitor_true_residual": None,
         }
 
-    pressure_family = "DG"
-    velocity_family = "DG"
-    U = VectorFunctionSpace(mesh, velocity_family, degree)
-    V = FunctionSpace(mesh, pressure_family, degree)
-    W = U * V
-
-    # Trial and test functions
-    DPP_solution = Function(W)
-    u, p = TrialFunctions(W)
-    v, q = TestFunctions(W)
-
-    # Mesh entities
-    n = FacetNormal(mesh)
-    h = CellDiameter(mesh)
-    x, y = SpatialCoordinate(mesh)
-
-    # Permeability
-    k = conditional(
-        y <= 0.8,
-        80 * k_ref,
-        conditional(
-            y <= 1.6,
-            30 * k_ref,
-            conditional(y <= 2.4, 5 * k_ref, conditional(y <= 3.2, 50 * k_ref, 10 * k_ref)),
-        ),
+    DPP_solution, problem_flow = formulations.build_problem(
+        "dgls",
+        mesh,
+        degree,
+        _porosity(mesh),
+        mesh_parameter=mesh_parameter,
+        delta_0=delta_0,
+        delta_1=delta_1,
+        delta_2=delta_2,
+        delta_3=delta_3,
+        eta_p=eta_p,
+        eta_u=eta_u,
     )
 
-    def alpha():
-        return mu / k
-
-    def invalpha():
-        return 1.0 / alpha()
-
-    # Flux BCs
-    un_1 = -k / mu
-    un_2 = k / mu
-
-    # Average cell size and mesh dependent stabilization
-    h_avg = (h("+") + h("-")) / 2.0
-    if mesh_parameter:
-        delta_2 = delta_2 * h * h
-        delta_3 = delta_3 * h * h
-
-    # Mixed classical terms
-    a = (dot(alpha() * u, v) - div(v) * p - delta_0 * q * div(u)) * dx
-    L = -delta_0 * f * q * dx - delta_0 * dot(rhob, v) * dx
-    # DG terms
-    a += jump(v, n) * avg(p) * dS - avg(q) * jump(u, n) * dS
-    # Edge stabilizing terms
-    a += (eta_u * h_avg) * avg(alpha()) * (jump(u, n) * jump(v, n)) * dS + (eta_p / h_avg) * avg(
-        1.0 / alpha()
-    ) * dot(jump(q, n), jump(p, n)) * dS
-    # Volume stabilizing terms
-    ###
-    a += delta_1 * inner(invalpha() * (alpha() * u + grad(p)), delta_0 * alpha() * v + grad(q)) * dx
-    ###
-    a += delta_2 * alpha() * div(u) * div(v) * dx
-    L += delta_2 * alpha() * f * div(v) * dx
-    ###
-    a += delta_3 * inner(invalpha() * curl(alpha() * u), curl(alpha() * v)) * dx
-    # Weakly imposed BC by Nitsche's method
-    a += dot(v, n) * p * ds - q * dot(u, n) * ds
-    L += (
-        -q * un_1 * ds(1)
-        - q * un_2 * ds(2)
-        - delta_1 * dot(delta_0 * alpha() * v + grad(q), invalpha() * rhob) * dx
-    )
-    a += eta_u / h * inner(dot(v, n), dot(u, n)) * ds
-    L += eta_u / h * dot(v, n) * un_1 * ds(1) + eta_u / h * dot(v, n) * un_2 * ds(2)
-
     #  Solving
-    problem_flow = LinearVariationalProblem(a, L, DPP_solution, bcs=[], constant_jacobian=False)
     solver_flow = LinearVariationalSolver(
         problem_flow, options_prefix="dpp_flow", solver_parameters=solver_parameters
     )
@@ -249,67 +114,20 @@ def cgls(
             "ksp_monitor_true_residual": None,
         }
 
-    pressure_family = "CG"
-    velocity_family = "CG"
-    U = VectorFunctionSpace(mesh, velocity_family, degree)
-    V = FunctionSpace(mesh, pressure_family, degree)
-    W = U * V
-
-    # Trial and test functions
-    DPP_solution = Function(W)
-    u, p = TrialFunctions(W)
-    v, q = TestFunctions(W)
-
-    # Mesh entities
-    n = FacetNormal(mesh)
-    h = CellDiameter(mesh)
-    x, y = SpatialCoordinate(mesh)
-
-    # Permeability
-    k = conditional(
-        y <= 0.8,
-        80 * k_ref,
-        conditional(
-            y <= 1.6,
-            30 * k_ref,
-            conditional(y <= 2.4, 5 * k_ref, conditional(y <= 3.2, 50 * k_ref, 10 * k_ref)),
-        ),
+    DPP_solution, problem_flow = formulations.build_problem(
+        "cgls",
+        mesh,
+        degree,
+        _porosity(mesh),
+        mesh_parameter=mesh_parameter,
+        delta_0=delta_0,
+        delta_1=delta_1,
+        delta_2=delta_2,
+        delta_3=delta_3,
+        eta_u=eta_u,
     )
 
-    def alpha():
-        return mu / k
-
-    def invalpha():
-        return 1.0 / alpha()
-
-    #  Flux BCs
-    un_1 = -k / mu
-    un_2 = k / mu
-
-    # Mesh stabilizing parameter
-    if mesh_parameter:
-        delta_2 = delta_2 * h * h
-        delta_3 = delta_3 * h * h
-
-    # Mixed classical terms
-    a = (dot(alpha() * u, v) - div(v) * p - delta_0 * q * div(u)) * dx
-    L = -delta_0 * f * q * dx - delta_0 * dot(rhob, v) * dx
-    # Volume stabilizing terms
-    ###
-    a += delta_1 * inner(invalpha() * (alpha() * u + grad(p)), delta_0 * alpha() * v + grad(q)) * dx
-    ###
-    a += delta_2 * alpha() * div(u) * div(v) * dx
-    L += delta_2 * alpha() * f * div(v) * dx
-    ###
-    a += delta_3 * inner(invalpha() * curl(alpha() * u), curl(alpha() * v)) * dx
-    # Weakly imposed BC by Nitsche's method
-    a += dot(v, n) * p * ds - q * dot(u, n) * ds
-    L += -q * un_1 * ds(1) - q * un_2 * ds(2)
-    a += eta_u / h * inner(dot(v, n), dot(u, n)) * ds
-    L += eta_u / h * dot(v, n) * un_1 * ds(1) + eta_u / h * dot(v, n) * un_2 * ds(2)
-
     #  Solving
-    problem_flow = LinearVariationalProblem(a, L, DPP_solution, bcs=[], constant_jacobian=False)
     solver_flow = LinearVariationalSolver(
         problem_flow, options_prefix="dpp_flow", solver_parameters=solver_parameters
     )
@@ -320,6 +138,19 @@ def cgls(
     return p_sol, v_sol
 
 
+def _porosity(mesh):
+    # Permeability
+    k = myk(mesh)
+
+    # Inflow on the left, outflow on the right and no flow on the top and bottom
+    bcs = [
+        formulations.WeakBC(flux=-k / mu, subdomain=1),
+        formulations.WeakBC(flux=k / mu, subdomain=2),
+        formulations.WeakBC(flux=0, subdomain=(3, 4)),
+    ]
+    return [formulations.Porosity(mu, k, rhob, bcs, f)]
+
+
 def _decompose_numerical_solution_hybrid(solution):
     v_sol = solution.sub(0)
     v_sol.rename("Velocity", "label")
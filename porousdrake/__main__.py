@@ -0,0 +1,107 @@
+"""
+Command line interface of porousdrake.
+
+Usage: python -m porousdrake warmup [--cache-dir DIR] [--methods ...] [--degrees ...]
+       python -m porousdrake run CASE_FILE [--cache-dir DIR] [--dry-run]
+
+The run command expands a case file (see porousdrake.cases) into jobs and dispatches them.
+
+The --cache-dir option points the PyOP2 and TSFC disk caches to DIR (as the PYOP2_CACHE_DIR and
+FIREDRAKE_TSFC_KERNEL_CACHE_DIR variables do), so the kernels compiled by the warm-up are found by
+the production runs using the same directory.
+"""
+
+import argparse
+import os
+import sys
+
+
+def set_cache_dir(cache_dir):
+    # The cache locations are read when Firedrake is imported, so this must be called before
+    if cache_dir is None:
+        return
+    cache_dir = os.path.abspath(cache_dir)
+    os.environ["PYOP2_CACHE_DIR"] = os.path.join(cache_dir, "pyop2")
+    os.environ["FIREDRAKE_TSFC_KERNEL_CACHE_DIR"] = os.path.join(cache_dir, "tsfc")
+
+
+def _warmup(options):
+    set_cache_dir(options.cache_dir)
+    from porousdrake import warmup
+
+    tasks = warmup.warmup_tasks(
+        methods=options.methods,
+        degrees=options.degrees,
+        quadrilaterals=[cell == "quad" for cell in options.cells],
+        mesh_parameters=[mesh_parameter == "true" for mesh_parameter in options.mesh_parameters],
+        studies=options.studies,
+        preconditioner=options.preconditioner,
+        matrix_free=options.matrix_free,
+    )
+    warmup.run_warmup(tasks, numel_xy=options.numel_xy, num_groups=options.groups)
+    return 0
+
+
+def _run(options):
+    from porousdrake import cases
+
+    case = cases.load_case_file(options.case_file)
+    dispatch = cases.dispatch_options(case)
+    if options.dry_run:
+        for job in cases.build_jobs(case):
+            print("%s (degree %d)" % (job["name"], job["degree"]))
+        return 0
+
+    set_cache_dir(options.cache_dir or dispatch["cache_dir"])
+    jobs = cases.build_jobs(case)
+    cases.run_jobs(
+        jobs, mode=dispatch["mode"], groups=dispatch["groups"], processes=dispatch["processes"]
+    )
+    return 0
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="porousdrake", description="Porousdrake commands")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    warmup_parser = subparsers.add_parser(
+        "warmup", help="compile the flow solver kernels into the disk caches"
+    )
+    warmup_parser.add_argument("--cache-dir", default=None)
+    warmup_parser.add_argument(
+        "--methods", nargs="+", default=["sdhm", "sdhm_monolithic", "dgls", "cgls"]
+    )
+    warmup_parser.add_argument("--degrees", nargs="+", type=int, default=[1, 2, 3, 4])
+    warmup_parser.add_argument(
+        "--cells", nargs="+", choices=["tri", "quad"], default=["tri", "quad"]
+    )
+    warmup_parser.add_argument(
+        "--mesh-parameters", nargs="+", choices=["true", "false"], default=["true", "false"]
+    )
+    warmup_parser.add_argument(
+        "--studies",
+        nargs="+",
+        choices=["dpp_convergence", "dpp_velocity_patch", "spp_convergence", "spp_velocity_patch"],
+        default=["dpp_convergence", "dpp_velocity_patch", "spp_convergence", "spp_velocity_patch"],
+    )
+    # Solver options of the production runs, see setup.solvers_parameters.solver_options
+    warmup_parser.add_argument("--preconditioner", choices=["lu", "gamg", "hypre"], default=None)
+    warmup_parser.add_argument("--matrix-free", action="store_true")
+    warmup_parser.add_argument("--numel-xy", type=int, default=4)
+    # Number of combinations compiled concurrently (defaults to one per rank)
+    warmup_parser.add_argument("--groups", type=int, default=None)
+    warmup_parser.set_defaults(func=_warmup)
+
+    run_parser = subparsers.add_parser("run", help="run the jobs of a TOML/YAML case file")
+    run_parser.add_argument("case_file")
+    run_parser.add_argument("--cache-dir", default=None)
+    run_parser.add_argument("--dry-run", action="store_true", help="only list the jobs")
+    run_parser.set_defaults(func=_run)
+
+    options = parser.parse_args(args)
+    return options.func(options)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
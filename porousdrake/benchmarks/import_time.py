@@ -0,0 +1,148 @@
+"""
+Import-time benchmark of the porousdrake modules.
+
+Each module is imported in a fresh interpreter with python -X importtime, which reports the time
+spent and the tree of imported modules. A module regresses when its import time grows more than
+the tolerance over a stored baseline, or when it directly imports one of the optional
+dependencies (matplotlib, scipy), which must only be loaded by the functions using them.
+
+Usage: python -m porousdrake.benchmarks.import_time [--baseline FILE] [--save-baseline]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+benchmark_modules = [
+    "porousdrake.__main__",
+    "porousdrake.cases",
+    "porousdrake.formulations",
+    "porousdrake.DPP.convergence.solvers",
+    "porousdrake.DPP.convergence.processor",
+    "porousdrake.DPP.velocity_patch.solvers",
+    "porousdrake.DPP.tracer.solvers",
+    "porousdrake.SPP.convergence.solvers",
+    "porousdrake.SPP.velocity_patch.solvers",
+    "porousdrake.post_processing.writers",
+    "porousdrake.post_processing.matrix_statistics",
+]
+
+# Optional dependencies that porousdrake modules must not import when they are loaded
+lazy_dependencies = ["matplotlib", "scipy"]
+
+
+def import_time(module, repeat=3):
+    """Best import time (s) of a module over repeat fresh interpreters, and the lazy dependencies
+    it imported directly."""
+    best_time = None
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import %s" % module],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError("Importing %s failed:\n%s" % (module, result.stderr[-2000:]))
+        imports = _parse_importtime(result.stderr)
+        total_time = sum(cumulative for depth, name, cumulative in imports if depth == 0)
+        if best_time is None or total_time < best_time:
+            best_time = total_time
+    return best_time * 1e-6, _eager_dependencies(imports)
+
+
+def _parse_importtime(output):
+    # Lines are "import time: self [us] | cumulative | <indentation>name", the indentation being
+    # two spaces per nesting level
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((depth, name.strip(), int(fields[1])))
+    return imports
+
+
+def _eager_dependencies(imports):
+    # The imported modules are reported after their children, so the importer of a module is
+    # known when the tree is walked backwards
+    eager = set()
+    parents = []
+    for depth, name, cumulative in reversed(imports):
+        del parents[depth:]
+        root = name.split(".")[0]
+        if root in lazy_dependencies and parents and parents[-1].startswith("porousdrake"):
+            eager.add("%s (imported by %s)" % (root, parents[-1]))
+        parents.append(name)
+    return sorted(eager)
+
+
+def run_benchmark(modules=benchmark_modules, repeat=3):
+    records = {}
+    for module in modules:
+        elapsed, eager = import_time(module, repeat=repeat)
+        print("%-50s %8.3f s %s" % (module, elapsed, ", ".join(eager)))
+        records[module] = {"time": elapsed, "eager_dependencies": eager}
+    return records
+
+
+def compare_to_baseline(records, filename, tolerance=0.2):
+    """Modules whose import time grew more than the tolerance over the baseline."""
+    with open(filename) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = []
+    for module, baseline_time in baseline.items():
+        if module not in records:
+            continue
+        current_time = records[module]["time"]
+        if current_time > (1.0 + tolerance) * baseline_time:
+            regressions.append((module, baseline_time, current_time))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=benchmark_modules)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default="import_time_baseline.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    options = parser.parse_args(args)
+
+    records = run_benchmark(options.modules, repeat=options.repeat)
+    failed = False
+    for module, record in records.items():
+        for dependency in record["eager_dependencies"]:
+            print("Eager import in %s: %s" % (module, dependency))
+            failed = True
+
+    if options.save_baseline:
+        with open(options.baseline, "w") as baseline_file:
+            json.dump(
+                {module: record["time"] for module, record in records.items()},
+                baseline_file,
+                indent=4,
+                sort_keys=True,
+            )
+        return 1 if failed else 0
+    if not os.path.exists(options.baseline):
+        print("No baseline found at %s" % options.baseline)
+        return 1 if failed else 0
+
+    regressions = compare_to_baseline(records, options.baseline, tolerance=options.tolerance)
+    for module, baseline_time, current_time in regressions:
+        print(
+            "Regression: importing %s takes %.3f s (baseline: %.3f s)"
+            % (module, current_time, baseline_time)
+        )
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Iteration counts of the DPP sdhm preconditioners over a ladder of meshes.
+
+The sdhm convergence problem is solved with each solver of the condensed traces ("lu", "gamg",
+"hypre"), with the porosities condensed separately (Schur complement coupling) or together
+(monolithic). The outer Krylov iterations, and the iterations of the condensed trace systems, are
+recorded per mesh: a scalable preconditioner keeps them bounded as the mesh is refined.
+
+Usage: python -m porousdrake.benchmarks.iteration_counts [--preconditioners ...] [--numel-xy ...]
+"""
+
+import argparse
+import sys
+
+from firedrake import *
+from firedrake.petsc import PETSc
+
+from porousdrake.DPP.convergence.solvers import DPPSolver
+from porousdrake.post_processing.results_store import ResultsStore
+import porousdrake.setup.solvers_parameters as parameters
+
+iteration_columns = [
+    "timestamp",
+    "preconditioner",
+    "monolithic",
+    "degree",
+    "n",
+    "num_dofs",
+    "outer_iterations",
+    "trace_iterations",
+    "error",
+]
+
+
+def run_case(preconditioner, monolithic, mesh, degree):
+    method = "sdhm_monolithic" if monolithic else "sdhm"
+    kwargs = dict(parameters.solvers_args["sdhm_full"])
+    dpp_solver = DPPSolver(method, mesh, degree, preconditioner=preconditioner, **kwargs)
+    dpp_solver.solve()
+    errors = dpp_solver.compute_errors()
+
+    # The monolithic outer solve is a single application of the static condensation; otherwise
+    # each porosity block is condensed by its own SCPC, and the largest of their last solves of
+    # the condensed traces is recorded
+    if monolithic:
+        trace_iterations = dpp_solver.pc.getPythonContext().condensed_ksp.getIterationNumber()
+    else:
+        trace_iterations = max(
+            sub_ksp.getPC().getPythonContext().condensed_ksp.getIterationNumber()
+            for sub_ksp in dpp_solver.pc.getFieldSplitSubKSP()
+        )
+    return {
+        "preconditioner": preconditioner,
+        "monolithic": monolithic,
+        "degree": degree,
+        "num_dofs": dpp_solver.num_dofs,
+        "outer_iterations": dpp_solver.ksp_iterations,
+        "trace_iterations": trace_iterations,
+        "error": max(field_errors["L2"] for field_errors in errors.values()),
+    }
+
+
+def run_benchmark(
+    preconditioners=["lu", "gamg", "hypre"],
+    monolithic_modes=[False, True],
+    numel_xy=[8, 16, 32, 64],
+    degree=1,
+    quadrilateral=True,
+    filename="iteration_counts.csv",
+    comm=COMM_WORLD,
+):
+    results_store = ResultsStore(filename, iteration_columns, comm=comm)
+    records = []
+    for preconditioner in preconditioners:
+        for monolithic in monolithic_modes:
+            for n in numel_xy:
+                mesh = UnitSquareMesh(n, n, quadrilateral=quadrilateral, comm=comm)
+                record = run_case(preconditioner, monolithic, mesh, degree)
+                record.update(n=n)
+                results_store.append(**record)
+                records.append(record)
+                PETSc.Sys.Print(
+                    "%-6s monolithic=%-5s n=%4d dofs=%9d outer its=%4d trace its=%4d"
+                    % (
+                        preconditioner,
+                        monolithic,
+                        n,
+                        record["num_dofs"],
+                        record["outer_iterations"],
+                        record["trace_iterations"],
+                    ),
+                    comm=comm,
+                )
+    return records
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--preconditioners",
+        nargs="+",
+        choices=["lu", "gamg", "hypre"],
+        default=["lu", "gamg", "hypre"],
+    )
+    parser.add_argument("--numel-xy", nargs="+", type=int, default=[8, 16, 32, 64])
+    parser.add_argument("--degree", type=int, default=1)
+    parser.add_argument("--triangles", action="store_true")
+    parser.add_argument("--output", default="iteration_counts.csv")
+    options = parser.parse_args(args)
+
+    run_benchmark(
+        preconditioners=options.preconditioners,
+        numel_xy=options.numel_xy,
+        degree=options.degree,
+        quadrilateral=not options.triangles,
+        filename=options.output,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
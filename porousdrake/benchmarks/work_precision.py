@@ -0,0 +1,195 @@
+"""
+Cost-per-accuracy benchmark of the DPP solvers.
+
+Every entry of setup.solvers_parameters.solvers_args is run on the DPP convergence problem over a
+ladder of meshes and degrees. Each case records its wall time, memory, DoFs, nonzeros and error,
+and the work-precision data (time to reach a given error) can be compared against a stored
+baseline to flag regressions. The wall time is the one of a second (assembly and solve) run of the
+case, so it does not depend on whether the TSFC/PyOP2 kernel caches were warm.
+
+Usage: python -m porousdrake.benchmarks.work_precision [--baseline FILE] [--save-baseline]
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from firedrake import *
+from firedrake.petsc import PETSc
+from mpi4py import MPI
+
+from porousdrake import profiling
+from porousdrake.DPP.convergence.solvers import DPPSolver
+from porousdrake.post_processing.results_store import ResultsStore
+import porousdrake.setup.solvers_parameters as parameters
+
+benchmark_columns = [
+    "timestamp",
+    "method",
+    "degree",
+    "n",
+    "quadrilateral",
+    "num_dofs",
+    "nonzeros",
+    "wall_time",
+    "rss_growth",
+    "error",
+]
+
+
+def run_case(method, mesh, degree, comm=COMM_WORLD):
+    kwargs = dict(parameters.solvers_args[method])
+    rss_before = profiling.resident_memory(comm)
+    dpp_solver = DPPSolver(parameters.solvers_methods[method], mesh, degree, **kwargs)
+
+    # The first solve compiles every kernel (including the PyOP2 and Slate ones built on first
+    # use), so only the second one is timed
+    dpp_solver.solve()
+    start = time.time()
+    dpp_solver.solve()
+    wall_time = comm.allreduce(time.time() - start, op=MPI.MAX)
+
+    # The accuracy of a case is measured by the L2 error of all the fields together
+    errors = dpp_solver.compute_errors()
+    error = np.sqrt(sum(field_errors["L2"] ** 2 for field_errors in errors.values()))
+
+    # Resident memory held by the case (kB), summed over the ranks
+    rss_growth = profiling.resident_memory(comm) - rss_before
+
+    return {
+        "method": method,
+        "degree": degree,
+        "num_dofs": dpp_solver.num_dofs,
+        "nonzeros": _nonzeros(dpp_solver),
+        "wall_time": wall_time,
+        "rss_growth": rss_growth,
+        "error": error,
+    }
+
+
+def _nonzeros(dpp_solver):
+    # Only available when the preconditioning matrix is assembled (not for the matfree sdhm)
+    pmat = dpp_solver.ksp.getOperators()[1]
+    if pmat.getType() == "python":
+        return ""
+    return int(pmat.getInfo(PETSc.Mat.InfoType.GLOBAL_SUM)["nz_used"])
+
+
+def run_benchmark(
+    methods=None,
+    numel_xy=[4, 8, 16, 32],
+    degrees=[1, 2, 3],
+    quadrilateral=True,
+    filename="benchmark_results.csv",
+    comm=COMM_WORLD,
+):
+    if methods is None:
+        methods = list(parameters.solvers_args)
+    results_store = ResultsStore(filename, benchmark_columns, comm=comm)
+    records = []
+    for method in methods:
+        for degree in degrees:
+            for n in numel_xy:
+                PETSc.Sys.Print("*** Benchmark: %s, degree %d, n = %d ***" % (method, degree, n))
+                mesh = UnitSquareMesh(n, n, quadrilateral=quadrilateral, comm=comm)
+                record = run_case(method, mesh, degree, comm=comm)
+                record.update(n=n, quadrilateral=quadrilateral)
+                results_store.append(**record)
+                records.append(record)
+
+                # The exact fields cached on the mesh refer to it, so the collector frees the case
+                del mesh
+                gc.collect()
+    return records
+
+
+def time_to_error(records, target_error):
+    """Time needed by each (method, degree) to reach the target error.
+
+    The time is interpolated in log-log scale between the cases bracketing the target error; it is
+    None when the target error is not reached on the meshes of the benchmark.
+    """
+    work_precision = {}
+    for key in sorted({(record["method"], record["degree"]) for record in records}):
+        cases = sorted(
+            (record for record in records if (record["method"], record["degree"]) == key),
+            key=lambda record: record["error"],
+        )
+        errors = np.array([float(record["error"]) for record in cases])
+        times = np.array([float(record["wall_time"]) for record in cases])
+        if errors[0] > target_error:
+            work_precision["%s_degree%d" % key] = None
+        else:
+            work_precision["%s_degree%d" % key] = float(
+                np.exp(np.interp(np.log(target_error), np.log(errors), np.log(times)))
+            )
+    return work_precision
+
+
+def save_baseline(records, filename, target_errors=[1e-2, 1e-3, 1e-4]):
+    baseline = {
+        "%g" % target_error: time_to_error(records, target_error) for target_error in target_errors
+    }
+    with open(filename, "w") as baseline_file:
+        json.dump(baseline, baseline_file, indent=4, sort_keys=True)
+    return baseline
+
+
+def compare_to_baseline(records, filename, tolerance=0.2):
+    """Cases whose time to reach the baseline target errors grew more than the tolerance."""
+    with open(filename) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = []
+    for target_error, baseline_times in baseline.items():
+        current_times = time_to_error(records, float(target_error))
+        for case, baseline_time in baseline_times.items():
+            current_time = current_times.get(case)
+            if baseline_time is None or case not in current_times:
+                continue
+            if current_time is None or current_time > (1.0 + tolerance) * baseline_time:
+                regressions.append((case, float(target_error), baseline_time, current_time))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--methods", nargs="+", default=None)
+    parser.add_argument("--numel-xy", nargs="+", type=int, default=[4, 8, 16, 32])
+    parser.add_argument("--degrees", nargs="+", type=int, default=[1, 2, 3])
+    parser.add_argument("--triangles", action="store_true")
+    parser.add_argument("--output", default="benchmark_results.csv")
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    options = parser.parse_args(args)
+
+    records = run_benchmark(
+        methods=options.methods,
+        numel_xy=options.numel_xy,
+        degrees=options.degrees,
+        quadrilateral=not options.triangles,
+        filename=options.output,
+    )
+    if options.save_baseline:
+        if COMM_WORLD.rank == 0:
+            save_baseline(records, options.baseline)
+        return 0
+    if not os.path.exists(options.baseline):
+        PETSc.Sys.Print("No baseline found at %s" % options.baseline)
+        return 0
+
+    regressions = compare_to_baseline(records, options.baseline, tolerance=options.tolerance)
+    for case, target_error, baseline_time, current_time in regressions:
+        PETSc.Sys.Print(
+            "Regression: %s takes %s s to reach error %g (baseline: %g s)"
+            % (case, current_time, target_error, baseline_time)
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+"""
+Caching of fields built on a mesh.
+"""
+
+import functools
+
+
+def cached_on_mesh(function):
+    """Cache the results of function(mesh, *args) on the mesh itself.
+
+    The cached fields are defined on the mesh and refer to it, so they can not be held by a cache
+    outside of the mesh (even with weak references) without keeping it alive. Stored on the mesh,
+    they are freed with it, so a sweep over many meshes only keeps the fields of the live ones.
+    """
+    attribute = "_porousdrake_cache_%s_%s" % (
+        function.__module__.replace(".", "_"),
+        function.__name__,
+    )
+
+    @functools.wraps(function)
+    def cached_function(mesh, *args, **kwargs):
+        cache = getattr(mesh, attribute, None)
+        if cache is None:
+            cache = {}
+            setattr(mesh, attribute, cache)
+        key = (args, tuple(sorted(kwargs.items())))
+        if key not in cache:
+            cache[key] = function(mesh, *args, **kwargs)
+        return cache[key]
+
+    return cached_function
@@ -0,0 +1,253 @@
+"""
+Case files of the DPP convergence and velocity patch studies.
+
+A case file (TOML, or YAML when PyYAML is installed) replaces the module globals edited in
+DPP/run_convergence.py and DPP/run_velocity_patch.py. Each study lists its solvers (entries of
+setup.solvers_parameters.solvers_args), degrees, cell types and mesh parameters, which are
+expanded into independent jobs. The optional preconditioner ("lu", "gamg" or "hypre") and
+monolithic keys select the trace solver and condensation of its sdhm solvers. The dispatch table
+tells how the jobs are run:
+
+    [convergence]
+    solvers = ["dmgls_full", "sdhm_full"]
+    degrees = [1, 2, 3, 4]
+    cells = ["tri", "quad"]
+    mesh_parameters = [true, false]
+    numel_xy = [5, 10, 15, 20, 25, 30]
+    preconditioner = "gamg"
+
+    [convergence.parameters.sdhm_full]
+    beta_0 = 1e-3
+
+    [velocity_patch]
+    solvers = ["cgls_full", "sdhm_full"]
+    degrees = [1]
+    cells = ["quad"]
+    mesh_parameters = [true]
+    nx = 50
+    ny = 30
+    Lx = 5.0
+    Ly = 4.0
+    k1_file = "k1.npy"
+    output_dir = "velocity_patch/output"
+
+    [dispatch]
+    mode = "mpi"
+    groups = 4
+
+With the "mpi" mode, the jobs are distributed among groups MPI sub-communicators of COMM_WORLD
+(as by the convergence scheduler). With the "pool" mode, a single process launch runs them in a
+pool of local worker processes (processes of them, one per CPU by default). The convergence jobs
+write results_<name>/ as run_convergence does, and the velocity patch jobs write
+<output_dir>/<name>.pvd.
+"""
+
+import os
+
+_study_defaults = {
+    "convergence": {
+        "degrees": [1, 2, 3, 4],
+        "cells": ["tri", "quad"],
+        "mesh_parameters": [True, False],
+        "numel_xy": [5, 10, 15, 20, 25, 30],
+        "preconditioner": None,
+        "monolithic": False,
+        "parameters": {},
+    },
+    "velocity_patch": {
+        "degrees": [1],
+        "cells": ["quad"],
+        "mesh_parameters": [True],
+        "nx": 50,
+        "ny": 30,
+        "Lx": 5.0,
+        "Ly": 4.0,
+        "k1_file": None,
+        "k2_file": None,
+        "output_dir": "velocity_patch/output",
+        "preconditioner": None,
+        "monolithic": False,
+        "parameters": {},
+    },
+}
+
+_dispatch_defaults = {"mode": "mpi", "groups": None, "processes": None, "cache_dir": None}
+
+
+def load_case_file(filename):
+    if filename.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError(
+                "PyYAML is required to read %s, use a TOML case file instead" % filename
+            )
+        with open(filename) as case_file:
+            case = yaml.safe_load(case_file)
+    else:
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
+        with open(filename, "rb") as case_file:
+            case = tomllib.load(case_file)
+
+    unknown_tables = set(case) - set(_study_defaults) - {"dispatch"}
+    if unknown_tables:
+        raise ValueError("Unknown tables in %s: %s" % (filename, ", ".join(sorted(unknown_tables))))
+    return case
+
+
+def dispatch_options(case):
+    options = dict(_dispatch_defaults)
+    options.update(case.get("dispatch", {}))
+    if options["mode"] not in ("mpi", "pool"):
+        raise ValueError("Unknown dispatch mode '%s', use 'mpi' or 'pool'" % options["mode"])
+    return options
+
+
+def build_jobs(case):
+    """Independent jobs of the studies of a case, each holding all its settings."""
+    from porousdrake.DPP.convergence.scheduler import case_name
+    import porousdrake.setup.solvers_parameters as parameters
+
+    jobs = []
+    for study in ("convergence", "velocity_patch"):
+        if study not in case:
+            continue
+        settings = dict(_study_defaults[study])
+        settings.update(case[study])
+        if "solvers" not in settings:
+            raise ValueError("The %s study requires a list of solvers" % study)
+        unknown_solvers = set(settings["solvers"]) - set(parameters.solvers_args)
+        if unknown_solvers:
+            raise ValueError("Unknown solvers: %s" % ", ".join(sorted(unknown_solvers)))
+
+        for cell in settings["cells"]:
+            quadrilateral = cell == "quad"
+            for solver in settings["solvers"]:
+                options = parameters.solver_options(
+                    solver, settings["preconditioner"], settings["monolithic"]
+                )
+                for mesh_parameter in settings["mesh_parameters"]:
+                    for degree in settings["degrees"]:
+                        job = {
+                            "problem": study,
+                            "solver": solver,
+                            "quadrilateral": quadrilateral,
+                            "mesh_parameter": mesh_parameter,
+                            "degree": degree,
+                            "parameters": settings["parameters"].get(solver, {}),
+                            "options": options,
+                        }
+                        if study == "convergence":
+                            job["name"] = case_name(solver, mesh_parameter, quadrilateral, options)
+                            job["numel_xy"] = settings["numel_xy"]
+                        else:
+                            job["name"] = "%s_%s_degree%d" % (solver, cell, degree)
+                            if options.get("monolithic"):
+                                job["name"] += "_monolithic"
+                            if options.get("preconditioner"):
+                                job["name"] += "_" + options["preconditioner"]
+                            if not mesh_parameter:
+                                job["name"] += "_meshless_par"
+                            for key in ("nx", "ny", "Lx", "Ly", "k1_file", "k2_file", "output_dir"):
+                                job[key] = settings[key]
+                        jobs.append(job)
+    return jobs
+
+
+def run_job(job, comm=None):
+    from firedrake import COMM_WORLD
+
+    if comm is None:
+        comm = COMM_WORLD
+    if job["problem"] == "convergence":
+        _run_convergence_job(job, comm)
+    else:
+        _run_velocity_patch_job(job, comm)
+    return job["name"]
+
+
+def _run_convergence_job(job, comm):
+    from porousdrake.DPP.convergence import scheduler, solvers
+    import porousdrake.setup.solvers_parameters as parameters
+
+    solvers_options = {job["solver"]: getattr(solvers, parameters.solvers_methods[job["solver"]])}
+    scheduler.run_task(job, solvers_options, job["numel_xy"], comm=comm)
+
+
+def _run_velocity_patch_job(job, comm):
+    from firedrake import Constant, File, FunctionSpace, RectangleMesh
+    from firedrake.petsc import PETSc
+    from porousdrake.DPP.velocity_patch import solvers
+    import porousdrake.setup.solvers_parameters as parameters
+    from porousdrake.setup.permeability import load_permeability
+
+    PETSc.Sys.Print("*** Begin case: %s ***\n" % job["name"], comm=comm)
+    Lx, Ly = job["Lx"], job["Ly"]
+    mesh = RectangleMesh(
+        job["nx"], job["ny"], Lx, Ly, quadrilateral=job["quadrilateral"], comm=comm
+    )
+
+    # Heterogeneous permeability maps, the layered fields are used when they are not provided
+    permeability_fields = {}
+    for field_name in ("k1", "k2"):
+        filename = job[field_name + "_file"]
+        if filename:
+            kSpace = FunctionSpace(mesh, "DG", 0)
+            permeability_fields[field_name] = load_permeability(
+                filename, kSpace, ((0.0, Lx), (0.0, Ly))
+            )
+
+    solver = getattr(solvers, parameters.solvers_methods[job["solver"]])
+    kwargs = dict(parameters.solvers_args[job["solver"]])
+    kwargs.update(
+        {parameter_name: Constant(value) for parameter_name, value in job["parameters"].items()}
+    )
+    kwargs["mesh_parameter"] = job["mesh_parameter"]
+    kwargs.update(job["options"])
+    p1_sol, v1_sol, p2_sol, v2_sol = solver(
+        mesh=mesh, degree=job["degree"], **permeability_fields, **kwargs
+    )
+
+    if comm.rank == 0:
+        os.makedirs(job["output_dir"], exist_ok=True)
+    comm.Barrier()
+    output_file = File(os.path.join(job["output_dir"], job["name"] + ".pvd"), comm=comm)
+    output_file.write(p1_sol, v1_sol, p2_sol, v2_sol)
+    PETSc.Sys.Print("\n*** End case: %s ***" % job["name"], comm=comm)
+
+
+def run_jobs(jobs, mode="mpi", groups=None, processes=None):
+    if mode == "pool":
+        _run_pool_jobs(jobs, processes)
+    else:
+        _run_mpi_jobs(jobs, groups)
+
+
+def _run_mpi_jobs(jobs, num_groups=None):
+    from firedrake import COMM_WORLD
+    from porousdrake.DPP.convergence.scheduler import run_distributed
+
+    run_distributed(
+        lambda job, subcomm: run_job(job, comm=subcomm),
+        jobs,
+        num_groups=num_groups,
+        comm=COMM_WORLD,
+    )
+
+
+def _run_pool_jobs(jobs, processes=None):
+    import multiprocessing
+
+    # Each worker is an MPI singleton, so the pool cannot be combined with an MPI launch
+    for size_variable in ("OMPI_COMM_WORLD_SIZE", "PMI_SIZE", "MPI_LOCALNRANKS"):
+        if int(os.environ.get(size_variable, "1")) > 1:
+            raise ValueError("The pool mode must be run on a single process, use the mpi mode")
+
+    # Spawned (not forked) workers, since MPI and PETSc do not support being forked
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes) as pool:
+        for name in pool.imap_unordered(run_job, jobs):
+            print("Done: %s" % name, flush=True)
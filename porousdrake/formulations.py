@@ -0,0 +1,403 @@
+"""
+Stabilized mixed formulations of the single and double porosity/permeability Darcy flows.
+
+A problem is described by one Porosity per scale, holding its coefficients and its weakly imposed
+boundary conditions. The forms of the sdhm, dgls and cgls methods are built by the same code for
+the SPP and DPP convergence and velocity patch studies, so identical integrals compile to
+identical kernels, which are shared through the TSFC/PyOP2 caches.
+
+The DPP porosities are coupled by the mass exchange b_factor / (alpha_i k_i) (p_j - p_i), which
+enters the equations of each porosity as its source term, as the source f does in SPP.
+
+FlowSolver holds the problem of a method for re-solves, it is the base of the SPP and DPP solvers.
+"""
+
+from firedrake import *
+import time
+from porousdrake import profiling
+
+# Velocity, pressure and trace families of each method
+families = {
+    "sdhm": ("DG", "DG", "HDiv Trace"),
+    "dgls": ("DG", "DG", None),
+    "cgls": ("CG", "CG", None),
+}
+
+
+class WeakBC(object):
+    """Boundary condition weakly imposed on one porosity.
+
+    The pressure, the normal flux u.n or both are prescribed on subdomain, a boundary id, a tuple
+    of boundary ids or "everywhere". The sdhm imposes both through the trace; the dgls and cgls
+    impose the pressure when it is given, and the flux otherwise (by Nitsche's method).
+    """
+
+    def __init__(self, pressure=None, flux=None, subdomain="everywhere"):
+        if pressure is None and flux is None:
+            raise ValueError("A pressure or a flux is required")
+        self.pressure = pressure
+        self.flux = flux
+        self.subdomain = subdomain
+
+    def measure(self):
+        if self.subdomain == "everywhere":
+            return ds
+        return ds(self.subdomain)
+
+
+class Porosity(object):
+    """Coefficients and boundary conditions of the flow in one porosity."""
+
+    def __init__(self, mu, k, rhob, bcs, f=None):
+        self.mu = mu
+        self.k = k
+        self.rhob = rhob
+        self.bcs = bcs
+        self.f = f
+
+    def alpha(self):
+        return self.mu / self.k
+
+    def invalpha(self):
+        return 1.0 / self.alpha()
+
+
+def mixed_space(method, mesh, degree, num_porosities, monolithic=False):
+    """Mixed space of the method: (u, p[, lambda]) of each porosity, in order.
+
+    With monolithic (sdhm only), the traces of every porosity are the components of a single
+    vector field placed last, so the static condensation eliminates all the other fields at once.
+    """
+    velocity_family, pressure_family, trace_family = families[method]
+    U = VectorFunctionSpace(mesh, velocity_family, degree)
+    V = FunctionSpace(mesh, pressure_family, degree)
+    if trace_family is None:
+        return MixedFunctionSpace([U, V] * num_porosities)
+    if monolithic:
+        T = VectorFunctionSpace(mesh, trace_family, degree, dim=num_porosities)
+        return MixedFunctionSpace([U, V] * num_porosities + [T])
+    T = FunctionSpace(mesh, trace_family, degree)
+    return MixedFunctionSpace([U, V, T] * num_porosities)
+
+
+def build_problem(
+    method,
+    mesh,
+    degree,
+    porosities,
+    mesh_parameter=True,
+    b_factor=None,
+    monolithic=False,
+    form_compiler_parameters=None,
+    **stabilizing_parameters
+):
+    """Solution function and variational problem of a method.
+
+    The stabilizing_parameters are delta_0, ..., delta_3, and beta_0 (sdhm) or eta_u and eta_p
+    (dgls, and cgls with flux conditions). The sdhm problem is written as a residual of the
+    solution function (as required by the static condensation), the others as linear problems.
+    """
+    num_porosities = len(porosities)
+    W = mixed_space(method, mesh, degree, num_porosities, monolithic)
+    solution = Function(W)
+    if method == "sdhm":
+        unknowns = split(solution)
+    else:
+        unknowns = TrialFunctions(W)
+    fields = _porosity_fields(method, unknowns, num_porosities, monolithic)
+    tests = _porosity_fields(method, TestFunctions(W), num_porosities, monolithic)
+
+    # Mass exchange between the porosities, added to their sources
+    sources = [porosity.f for porosity in porosities]
+    if b_factor is not None:
+        if num_porosities != 2:
+            raise ValueError("The mass exchange requires two porosities")
+        p1, p2 = fields[0][1], fields[1][1]
+        exchanges = [p2 - p1, p1 - p2]
+        for i, porosity in enumerate(porosities):
+            exchange = (b_factor * porosity.invalpha() / porosity.k) * exchanges[i]
+            sources[i] = exchange if sources[i] is None else sources[i] + exchange
+
+    F = 0
+    for porosity_fields, porosity_tests, porosity, source in zip(
+        fields, tests, porosities, sources
+    ):
+        F += porosity_residual(
+            method,
+            mesh,
+            porosity_fields,
+            porosity_tests,
+            porosity,
+            source,
+            mesh_parameter,
+            **stabilizing_parameters
+        )
+
+    if method == "sdhm":
+        problem = NonlinearVariationalProblem(
+            F, solution, form_compiler_parameters=form_compiler_parameters
+        )
+    else:
+        problem = LinearVariationalProblem(
+            lhs(F),
+            rhs(F),
+            solution,
+            bcs=[],
+            constant_jacobian=False,
+            form_compiler_parameters=form_compiler_parameters,
+        )
+    return solution, problem
+
+
+def _porosity_fields(method, functions, num_porosities, monolithic):
+    # Groups the (u, p, lambda) of each porosity, lambda being None without traces
+    functions = list(functions)
+    if families[method][2] is None:
+        return [(functions[2 * i], functions[2 * i + 1], None) for i in range(num_porosities)]
+    if monolithic:
+        traces = functions[-1]
+        return [(functions[2 * i], functions[2 * i + 1], traces[i]) for i in range(num_porosities)]
+    return [tuple(functions[3 * i : 3 * i + 3]) for i in range(num_porosities)]
+
+
+def porosity_residual(
+    method,
+    mesh,
+    fields,
+    tests,
+    porosity,
+    source,
+    mesh_parameter,
+    delta_0,
+    delta_1,
+    delta_2,
+    delta_3,
+    beta_0=None,
+    eta_u=None,
+    eta_p=None,
+):
+    u, p, lambda_h = fields
+    v, q, mu_h = tests
+
+    # Mesh entities
+    n = FacetNormal(mesh)
+    h = CellDiameter(mesh)
+
+    alpha = porosity.alpha()
+    invalpha = porosity.invalpha()
+    rhob = porosity.rhob
+
+    # Mesh dependent stabilization
+    if mesh_parameter:
+        delta_2 = delta_2 * h * h
+        delta_3 = delta_3 * h * h
+
+    # Mixed classical terms
+    F = (dot(alpha * u, v) - div(v) * p - delta_0 * q * div(u)) * dx
+    F += delta_0 * dot(rhob, v) * dx
+    if source is not None:
+        F += delta_0 * q * source * dx
+    # Volume stabilizing terms
+    ###
+    F += delta_1 * inner(invalpha * (alpha * u + grad(p)), delta_0 * alpha * v + grad(q)) * dx
+    F += delta_1 * dot(delta_0 * alpha * v + grad(q), invalpha * rhob) * dx
+    ###
+    F += delta_2 * alpha * div(u) * div(v) * dx
+    if source is not None:
+        F += -delta_2 * alpha * source * div(v) * dx
+    ###
+    F += delta_3 * inner(invalpha * curl(alpha * u), curl(alpha * v)) * dx
+
+    if method == "dgls":
+        # DG terms
+        F += jump(v, n) * avg(p) * dS - avg(q) * jump(u, n) * dS
+        # Edge stabilizing terms
+        h_avg = (h("+") + h("-")) / 2.0
+        F += (eta_u * h_avg) * avg(alpha) * (jump(u, n) * jump(v, n)) * dS
+        F += (eta_p / h_avg) * avg(1.0 / alpha) * dot(jump(q, n), jump(p, n)) * dS
+    elif method == "sdhm":
+        # Hybridization terms
+        beta_avg = beta_0 / h("+")
+        F += lambda_h("+") * jump(v, n) * dS + mu_h("+") * jump(u, n) * dS
+        F += beta_avg * invalpha("+") * (lambda_h("+") - p("+")) * (mu_h("+") - q("+")) * dS
+
+    # Weakly imposed BCs
+    for bc in porosity.bcs:
+        F += _boundary_terms(method, mesh, bc, fields, tests, porosity, beta_0, eta_u)
+    return F
+
+
+def _boundary_terms(method, mesh, bc, fields, tests, porosity, beta_0, eta_u):
+    u, p, lambda_h = fields
+    v, q, mu_h = tests
+    n = FacetNormal(mesh)
+    h = CellDiameter(mesh)
+    ds_bc = bc.measure()
+    flux = bc.flux
+    if _is_zero(flux):
+        flux = None
+
+    if method == "sdhm":
+        # Imposed through the trace (hybridization)
+        if bc.pressure is not None:
+            beta = beta_0 / h
+            F = bc.pressure * dot(v, n) * ds_bc
+            F += beta * porosity.invalpha() * (lambda_h - bc.pressure) * mu_h * ds_bc
+        else:
+            F = lambda_h * dot(v, n) * ds_bc
+        if bc.flux is not None:
+            F += mu_h * dot(u, n) * ds_bc
+        if flux is not None:
+            F += -mu_h * flux * ds_bc
+        return F
+
+    if bc.pressure is not None:
+        return bc.pressure * dot(v, n) * ds_bc
+
+    # Flux imposed by Nitsche's method
+    F = (dot(v, n) * p - q * dot(u, n)) * ds_bc
+    F += eta_u / h * inner(dot(v, n), dot(u, n)) * ds_bc
+    if flux is not None:
+        F += (q * flux - eta_u / h * dot(v, n) * flux) * ds_bc
+    return F
+
+
+def _is_zero(value):
+    return isinstance(value, (int, float)) and value == 0
+
+
+class FlowSolver(object):
+    """Solver of a method built once per (method, mesh, degree).
+
+    The function spaces, forms and variational solver are kept, so the problem can be re-solved
+    after updating the stabilizing parameters without re-deriving the forms or rebuilding the
+    solver. With profile, the time of each phase is measured (see porousdrake.profiling) and kept
+    in the profile attribute.
+
+    Subclasses provide the methods (problem builder, stabilizing parameters with their default
+    values and default solver parameters of each method), the label of their logging stages, the
+    names of their fields and the decomposition of their numerical solution.
+    """
+
+    label = None
+    field_names = ()
+
+    def __init__(
+        self,
+        method,
+        mesh,
+        degree,
+        mesh_parameter=True,
+        solver_parameters={},
+        profile=False,
+        **kwargs
+    ):
+        if method not in self.methods:
+            raise ValueError(
+                "Unknown method '%s', available methods are: %s" % (method, ", ".join(self.methods))
+            )
+        build_problem, stabilizing_parameters, default_solver_parameters = self.methods[method]
+        unknown_parameters = set(kwargs) - set(stabilizing_parameters)
+        if unknown_parameters:
+            raise TypeError(
+                "Invalid parameters for %s: %s" % (method, ", ".join(sorted(unknown_parameters)))
+            )
+        self.method = method
+        self.mesh = mesh
+        self.degree = degree
+        self.mesh_parameter = mesh_parameter
+
+        # The solver owns its parameters, so updating them does not affect the caller's Constants
+        self.parameters = {}
+        for parameter_name, default_value in stabilizing_parameters.items():
+            value = kwargs.get(parameter_name, default_value)
+            self.parameters[parameter_name] = Constant(float(value))
+
+        build_kwargs, default_solver_parameters = self._solver_options(default_solver_parameters)
+        if not solver_parameters:
+            solver_parameters = default_solver_parameters
+
+        # Every phase is logged in a stage of the method, which is reported by -log_view
+        if profile:
+            profiling.begin()
+        self.stage = profiling.stage("%s %s" % (self.label, method))
+        with self.stage:
+            start_times = profiling.phase_times()
+            start = time.time()
+            with profiling.event("form construction"):
+                self.solution, self.problem, self.solver, self.exact_solution = build_problem(
+                    mesh,
+                    degree,
+                    mesh_parameter,
+                    solver_parameters,
+                    **build_kwargs,
+                    **self.parameters
+                )
+            self.setup_time = time.time() - start
+            self.setup_profile = profiling.elapsed_times(start_times)
+
+        # Costs of the last solve; the profile gathers the setup and the last solve phases
+        self.profile = dict(self.setup_profile)
+        self.assembly_time = 0.0
+        self.solve_time = 0.0
+        self.ksp_iterations = 0
+
+    def _solver_options(self, default_solver_parameters):
+        # Problem builder kwargs and default solver parameters of the method
+        return {}, default_solver_parameters
+
+    def _numerical_solution(self):
+        raise NotImplementedError
+
+    @property
+    def num_dofs(self):
+        return self.solution.function_space().dim()
+
+    @property
+    def snes(self):
+        return self.solver.snes
+
+    @property
+    def ksp(self):
+        return self.solver.snes.ksp
+
+    @property
+    def pc(self):
+        return self.solver.snes.ksp.getPC()
+
+    def update_parameters(self, **kwargs):
+        for parameter_name, value in kwargs.items():
+            if parameter_name not in self.parameters:
+                raise TypeError("Invalid parameter for %s: %s" % (self.method, parameter_name))
+            self.parameters[parameter_name].assign(value)
+
+    def solve(self):
+        """Solve the problem, returning the numerical fields followed by the exact ones."""
+        with self.stage:
+            start_times = profiling.phase_times()
+            start = time.time()
+            self.solver.solve()
+            solve_time = time.time() - start
+            solve_profile = profiling.elapsed_times(start_times)
+        self.profile = {
+            phase: self.setup_profile[phase] + solve_profile[phase] for phase in solve_profile
+        }
+        self.assembly_time = solve_profile["assembly"]
+        self.solve_time = solve_time - self.assembly_time
+        self.ksp_iterations = self.ksp.getIterationNumber()
+        return tuple(self._numerical_solution()) + tuple(self.exact_solution)
+
+    def compute_errors(self, norm_types=("L2",)):
+        """Error norms of the fields of the last solution, by field name.
+
+        See DPP.convergence.processor.compute_errors. They are evaluated in the solver stage, so
+        their cost is the error evaluation phase of the profile.
+        """
+        from porousdrake.DPP.convergence.processor import compute_errors
+
+        fields = dict(zip(self.field_names, zip(self._numerical_solution(), self.exact_solution)))
+        with self.stage:
+            start_times = profiling.phase_times(["error evaluation"])
+            errors = compute_errors(fields, norm_types=norm_types)
+            self.profile.update(profiling.elapsed_times(start_times))
+        return errors
@@ -0,0 +1,206 @@
+"""
+Algebraic statistics of the DPP formulations.
+
+For a method, mesh and degree, the Jacobian of the DPP problem is assembled (without solving it)
+and reported by its DoFs per field, nonzeros per block, bandwidth and an estimate of its condition
+number. For the sdhm methods, the same statistics are reported for the statically condensed trace
+systems, which are the systems actually factorized, so they can be compared against the dgls/cgls
+monolithic systems.
+"""
+
+from firedrake import *
+import numpy as np
+from firedrake.petsc import PETSc
+from mpi4py import MPI
+
+from porousdrake.DPP.convergence.solvers import DPPSolver
+
+# Names of the fields of each method, in the order of the mixed space
+field_names = {
+    "sdhm": ["u1", "p1", "lambda1", "u2", "p2", "lambda2"],
+    "sdhm_monolithic": ["u1", "p1", "u2", "p2", "lambda"],
+    "dgls": ["u1", "p1", "u2", "p2"],
+    "cgls": ["u1", "p1", "u2", "p2"],
+}
+
+# Condensed systems of the sdhm methods: (eliminated fields, trace field)
+condensed_blocks = {
+    "sdhm": [((0, 1), 2), ((3, 4), 5)],
+    "sdhm_monolithic": [((0, 1, 2, 3), 4)],
+}
+
+
+def nonzeros(petsc_mat):
+    return int(petsc_mat.getInfo(PETSc.Mat.InfoType.GLOBAL_SUM)["nz_used"])
+
+
+def bandwidth(petsc_mat):
+    """Largest distance between a nonzero entry and the diagonal."""
+    rows, cols = _local_entries(petsc_mat)
+    comm = petsc_mat.getComm().tompi4py()
+    return comm.allreduce(int(np.max(np.abs(cols - rows), initial=0)), op=MPI.MAX)
+
+
+def condition_number_estimate(petsc_mat, max_it=300):
+    """Ratio of the extreme singular values estimated by unpreconditioned GMRES.
+
+    The estimate comes from the Krylov subspace built in max_it iterations (without restart), so
+    it is a lower bound of the condition number, that gets sharper as max_it grows.
+    """
+    ksp = PETSc.KSP().create(comm=petsc_mat.getComm())
+    ksp.setOperators(petsc_mat)
+    ksp.setType("gmres")
+    ksp.setGMRESRestart(max_it)
+    ksp.getPC().setType("none")
+    ksp.setTolerances(rtol=1e-12, atol=0.0, max_it=max_it)
+    ksp.setComputeSingularValues(True)
+    x, b = petsc_mat.createVecs()
+    b.setRandom()
+    ksp.solve(b, x)
+    sigma_max, sigma_min = ksp.computeExtremeSingularValues()
+    ksp.destroy()
+    return sigma_max / sigma_min
+
+
+def block_nonzeros(petsc_mat, function_space):
+    """Nonzeros of each (row field, column field) block of a matrix on a mixed space."""
+    comm = petsc_mat.getComm().tompi4py()
+    num_fields = len(function_space)
+
+    # Field of each global DoF, gathered on every rank since the columns of the local rows may be
+    # owned by other ranks
+    field_of_dof = np.empty(function_space.dim(), dtype=np.int32)
+    for field, field_is in enumerate(function_space.dof_dset.field_ises):
+        field_of_dof[np.concatenate(comm.allgather(field_is.getIndices()))] = field
+
+    rows, cols = _local_entries(petsc_mat)
+    counts = np.bincount(
+        field_of_dof[rows] * num_fields + field_of_dof[cols], minlength=num_fields * num_fields
+    )
+    counts = comm.allreduce(counts, op=MPI.SUM)
+    return {
+        (i, j): int(counts[i * num_fields + j])
+        for i in range(num_fields)
+        for j in range(num_fields)
+    }
+
+
+def _local_entries(petsc_mat):
+    Mij = PETSc.Mat()
+    petsc_mat.convert("aij", Mij)
+    row_start, row_end = Mij.getOwnershipRange()
+    indptr, indices, values = Mij.getValuesCSR()
+    rows = np.repeat(np.arange(row_start, row_end), np.diff(indptr))
+    return rows, indices
+
+
+def system_statistics(petsc_mat, condition_number=True):
+    statistics = {
+        "num_dofs": petsc_mat.getSize()[0],
+        "nonzeros": nonzeros(petsc_mat),
+        "bandwidth": bandwidth(petsc_mat),
+    }
+    if condition_number:
+        statistics["condition_number"] = condition_number_estimate(petsc_mat)
+    return statistics
+
+
+def matrix_statistics(method, mesh, degree, condition_number=True, **kwargs):
+    """Statistics of the global and (for sdhm) condensed systems of a method.
+
+    The kwargs are the DPPSolver ones (mesh_parameter and the stabilizing parameters).
+    """
+    dpp_solver = DPPSolver(method, mesh, degree, **kwargs)
+    W = dpp_solver.solution.function_space()
+    J = dpp_solver.problem.J
+    A = assemble(J, bcs=dpp_solver.problem.bcs, mat_type="aij")
+    petsc_mat = A.M.handle
+
+    report = {
+        "method": method,
+        "degree": degree,
+        "num_cells": mesh.num_cells(),
+        "field_dofs": {name: W.sub(i).dim() for i, name in enumerate(field_names[method])},
+        "block_nonzeros": {
+            (field_names[method][i], field_names[method][j]): block_nnz
+            for (i, j), block_nnz in block_nonzeros(petsc_mat, W).items()
+        },
+        "global": system_statistics(petsc_mat, condition_number),
+        "condensed": [],
+    }
+
+    # Schur complements of the trace systems, as built by SCPC
+    blocks = Tensor(J).blocks
+    for eliminated, trace in condensed_blocks.get(method, []):
+        first, last = eliminated[0], eliminated[-1] + 1
+        S = (
+            blocks[trace, trace]
+            - blocks[trace, first:last]
+            * blocks[first:last, first:last].inv
+            * blocks[first:last, trace]
+        )
+        S_mat = assemble(S, mat_type="aij")
+        statistics = system_statistics(S_mat.M.handle, condition_number)
+        statistics["field"] = field_names[method][trace]
+        report["condensed"].append(statistics)
+
+    # Size of the systems that are factorized when solving
+    solved_systems = report["condensed"] or [report["global"]]
+    report["solved_dofs"] = sum(statistics["num_dofs"] for statistics in solved_systems)
+    report["solved_nonzeros"] = sum(statistics["nonzeros"] for statistics in solved_systems)
+    return report
+
+
+def compare_formulations(
+    mesh, degree, methods=("sdhm", "sdhm_monolithic", "dgls", "cgls"), condition_number=True
+):
+    reports = [
+        matrix_statistics(method, mesh, degree, condition_number=condition_number)
+        for method in methods
+    ]
+    print_reports(reports)
+    return reports
+
+
+def print_reports(reports):
+    PETSc.Sys.Print(
+        "%-16s %6s %10s %12s %10s %12s %12s %12s"
+        % (
+            "method",
+            "degree",
+            "dofs",
+            "nonzeros",
+            "bandwidth",
+            "cond",
+            "solved dofs",
+            "solved nnz",
+        )
+    )
+    for report in reports:
+        global_statistics = report["global"]
+        PETSc.Sys.Print(
+            "%-16s %6d %10d %12d %10d %12.3e %12d %12d"
+            % (
+                report["method"],
+                report["degree"],
+                global_statistics["num_dofs"],
+                global_statistics["nonzeros"],
+                global_statistics["bandwidth"],
+                global_statistics.get("condition_number", np.nan),
+                report["solved_dofs"],
+                report["solved_nonzeros"],
+            )
+        )
+        for statistics in report["condensed"]:
+            PETSc.Sys.Print(
+                "  condensed %-5s %6s %10d %12d %10d %12.3e"
+                % (
+                    statistics["field"],
+                    "",
+                    statistics["num_dofs"],
+                    statistics["nonzeros"],
+                    statistics["bandwidth"],
+                    statistics.get("condition_number", np.nan),
+                )
+            )
+    return
@@ -2,6 +2,7 @@
 Must of this module was created by Thomas Gibson from Imperial College/UK.
 Some parts are modified and adapted by Diego Volpatto.
 """
+
 import numpy as np
 import matplotlib.pyplot as plt
 from firedrake import *
@@ -11,122 +12,142 @@ my_cmap = plt.cm.winter
 my_cmap.set_bad(color="lightgray")
 
 
-def plot_matrix(a_form, bcs=[], **kwargs):
-    """Provides a plot of a matrix."""
-    fig, ax = plt.subplots(1, 1)
-
-    A = assemble(a_form, bcs=bcs, mat_type="aij")
-    petsc_mat = A.M.handle
-
-    size = petsc_mat.getSize()
-    Mij = PETSc.Mat()
-    petsc_mat.convert("aij", Mij)
-
-    n, m = size
-    Mnp = np.array(Mij.getValues(range(n), range(m)))
-    Am = np.ma.masked_values(Mnp, 0, rtol=1e-13)
-
-    # Plot the matrix
-    plot = ax.matshow(Am, cmap=my_cmap, **kwargs)
-
-    # Remove axis ticks and values
-    ax.tick_params(length=0)
-    ax.set_xticklabels([])
-    ax.set_yticklabels([])
-
-    return plot
-
+# Entries below this magnitude are not plotted
+zero_tolerance = 1e-8
 
-def plot_matrix_mixed(a_form, bcs=[], **kwargs):
-    """Provides a plot of a mixed matrix."""
-    fig, ax = plt.subplots(1, 1)
 
-    A = assemble(a_form, bcs=bcs, mat_type="aij")
-    petsc_mat = A.M.handle
+def csr_entries(petsc_mat):
+    """Row indices, column indices and values of the nonzero entries of an assembled matrix.
 
-    total_size = petsc_mat.getSize()
-    f0_size = A.M[0, 0].handle.getSize()
+    The entries are read from the CSR arrays of each rank and gathered on rank 0, so the cost is
+    proportional to the number of nonzeros and not to the square of the size. The other ranks
+    get None.
+    """
     Mij = PETSc.Mat()
     petsc_mat.convert("aij", Mij)
-
-    n, m = total_size
-    Mnp = np.array(Mij.getValues(range(n), range(m)))
-    Am = np.ma.masked_values(Mnp, 0, rtol=1e-13)
-
-    # Plot the matrix
-    plot = ax.matshow(Am, cmap=my_cmap, **kwargs)
+    row_start, row_end = Mij.getOwnershipRange()
+    indptr, indices, values = Mij.getValuesCSR()
+    rows = np.repeat(np.arange(row_start, row_end), np.diff(indptr))
+
+    comm = Mij.getComm().tompi4py()
+    if comm.size > 1:
+        rows = comm.gather(rows, root=0)
+        indices = comm.gather(indices, root=0)
+        values = comm.gather(values, root=0)
+        if comm.rank != 0:
+            return None
+        rows, indices, values = map(np.concatenate, (rows, indices, values))
+    nonzeros = np.abs(values) > zero_tolerance
+    return rows[nonzeros], indices[nonzeros], values[nonzeros]
+
+
+def field_ordering(function_space):
+    """Renumbering of the DoFs of a mixed space with the DoFs of each field numbered together.
+
+    In parallel, the global numbering interleaves the fields rank by rank, so the field blocks are
+    only contiguous after the renumbering. Returns the new number of each DoF and the field sizes
+    on rank 0, and None on the other ranks.
+    """
+    comm = function_space.comm
+    field_indices = [
+        comm.gather(field_is.getIndices(), root=0)
+        for field_is in function_space.dof_dset.field_ises
+    ]
+    if comm.rank != 0:
+        return None
+    field_indices = [np.concatenate(indices) for indices in field_indices]
+    ordering = np.empty(sum(len(indices) for indices in field_indices), dtype=int)
+    ordering[np.concatenate(field_indices)] = np.arange(len(ordering))
+    return ordering, [len(indices) for indices in field_indices]
+
+
+def plot_sparse_matrix(
+    petsc_mat, ax=None, function_space=None, method="auto", resolution=1000, cmap=my_cmap, **kwargs
+):
+    """Plot the nonzero pattern of a matrix from its CSR arrays, on rank 0 only.
+
+    With method="markers", each nonzero is drawn as a marker colored by its value (as matshow on
+    the dense matrix would). With method="density", the matrix is rasterized on a grid of at most
+    resolution x resolution pixels, colored by the number of nonzeros in each pixel, which suits
+    matrices with many more rows than pixels. "auto" picks markers up to resolution rows. Given
+    the mixed function space of the (square) matrix, its DoFs are grouped by field and lines are
+    drawn between the field blocks. The other ranks only take part in the gathers and get None.
+    """
+    n, m = petsc_mat.getSize()
+    entries = csr_entries(petsc_mat)
+    block_sizes = ()
+    if function_space is not None:
+        ordering = field_ordering(function_space)
+        if ordering is not None:
+            ordering, block_sizes = ordering
+    if entries is None:
+        return None
+    rows, cols, values = entries
+    if function_space is not None:
+        rows, cols = ordering[rows], ordering[cols]
+
+    if ax is None:
+        fig, ax = plt.subplots(1, 1)
+    if method == "auto":
+        method = "markers" if max(n, m) <= resolution else "density"
+    if method == "markers":
+        markersize = kwargs.pop("markersize", max(0.1, (72.0 * 4.0 / max(n, m)) ** 2))
+        plot = ax.scatter(cols, rows, c=values, s=markersize, marker="s", cmap=cmap, **kwargs)
+    elif method == "density":
+        bins = (min(n, resolution), min(m, resolution))
+        density, _, _ = np.histogram2d(rows, cols, bins=bins, range=((0, n), (0, m)))
+        plot = ax.imshow(
+            np.ma.masked_equal(density, 0),
+            cmap=cmap,
+            extent=(-0.5, m - 0.5, n - 0.5, -0.5),
+            interpolation="nearest",
+            **kwargs
+        )
+    else:
+        raise ValueError("Unknown plot method: %s" % method)
+    ax.set_xlim(-0.5, m - 0.5)
+    ax.set_ylim(n - 0.5, -0.5)
+    ax.set_aspect("equal")
+    ax.set_facecolor("lightgray")
 
     # Remove axis ticks and values
     ax.tick_params(length=0)
     ax.set_xticklabels([])
     ax.set_yticklabels([])
 
-    ax.axhline(y=f0_size[0] - 0.5, color="k")
-    ax.axvline(x=f0_size[0] - 0.5, color="k")
+    block_end = 0
+    for block_size in block_sizes[:-1]:
+        block_end += block_size
+        ax.axhline(y=block_end - 0.5, color="k")
+        ax.axvline(x=block_end - 0.5, color="k")
 
     return plot
 
 
-def plot_matrix_hybrid_full(a_form, bcs=[], **kwargs):
-    """Provides a plot of a full hybrid-mixed matrix."""
-    fig, ax = plt.subplots(1, 1)
-
+def plot_matrix(a_form, bcs=[], method="auto", **kwargs):
+    """Provides a plot of a matrix."""
     A = assemble(a_form, bcs=bcs, mat_type="aij")
-    petsc_mat = A.M.handle
+    return plot_sparse_matrix(A.M.handle, method=method, **kwargs)
 
-    total_size = petsc_mat.getSize()
-    f0_size = A.M[0, 0].handle.getSize()
-    f1_size = A.M[1, 1].handle.getSize()
 
-    Mij = PETSc.Mat()
-    petsc_mat.convert("aij", Mij)
-
-    n, m = total_size
-    Mnp = np.array(Mij.getValues(range(n), range(m)))
-    Am = np.ma.masked_values(Mnp, 0, rtol=1e-13)
-
-    # Plot the matrix
-    plot = ax.matshow(Am, cmap=my_cmap, **kwargs)
-
-    # Remove axis ticks and values
-    ax.tick_params(length=0)
-    ax.set_xticklabels([])
-    ax.set_yticklabels([])
+def plot_matrix_mixed(a_form, bcs=[], method="auto", **kwargs):
+    """Provides a plot of a mixed matrix."""
+    A = assemble(a_form, bcs=bcs, mat_type="aij")
+    V = a_form.arguments()[0].function_space()
+    return plot_sparse_matrix(A.M.handle, function_space=V, method=method, **kwargs)
 
-    ax.axhline(y=f0_size[0] - 0.5, color="k")
-    ax.axvline(x=f0_size[0] - 0.5, color="k")
-    ax.axhline(y=f0_size[0] + f1_size[0] - 0.5, color="k")
-    ax.axvline(x=f0_size[0] + f1_size[0] - 0.5, color="k")
 
-    return plot
+def plot_matrix_hybrid_full(a_form, bcs=[], method="auto", **kwargs):
+    """Provides a plot of a full hybrid-mixed matrix."""
+    A = assemble(a_form, bcs=bcs, mat_type="aij")
+    V = a_form.arguments()[0].function_space()
+    return plot_sparse_matrix(A.M.handle, function_space=V, method=method, **kwargs)
 
 
-def plot_matrix_hybrid_multiplier_spp(a_form, bcs=[], **kwargs):
+def plot_matrix_hybrid_multiplier_spp(a_form, bcs=[], method="auto", **kwargs):
     """Provides a plot of a condensed hybrid-mixed matrix for single scale problems."""
-    fig, ax = plt.subplots(1, 1)
-
     _A = Tensor(a_form)
     A = _A.blocks
     S = A[2, 2] - A[2, :2] * A[:2, :2].inv * A[:2, 2]
     Smat = assemble(S, bcs=bcs)
-
-    petsc_mat = Smat.M.handle
-    total_size = petsc_mat.getSize()
-    Mij = PETSc.Mat()
-    petsc_mat.convert("aij", Mij)
-
-    n, m = total_size
-    Mnp = np.array(Mij.getValues(range(n), range(m)))
-    Am = np.ma.masked_values(Mnp, 0, rtol=1e-13)
-
-    # Plot the matrix
-    plot = ax.matshow(Am, cmap=my_cmap, **kwargs)
-    # Below there is the spy alternative
-    # plot = plt.spy(Am, **kwargs)
-
-    # Remove axis ticks and values
-    ax.tick_params(length=0)
-    ax.set_xticklabels([])
-    ax.set_yticklabels([])
-
-    return plot
+    return plot_sparse_matrix(Smat.M.handle, method=method, **kwargs)
@@ -0,0 +1,19 @@
+"""
+Lazy access to matplotlib.
+
+Importing pyplot is slow, and useless on headless batch runs, so the modules get it from pyplot()
+only when they actually plot.
+"""
+
+_pyplot = None
+
+
+def pyplot():
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib.pyplot as plt
+
+        plt.rcParams["contour.corner_mask"] = False
+        plt.close("all")
+        _pyplot = plt
+    return _pyplot
@@ -0,0 +1,69 @@
+import csv
+import hashlib
+import json
+import os
+import time
+from firedrake import COMM_WORLD
+
+
+class ResultsStore(object):
+    """Append-only table of results, stored as a CSV file with one row per case.
+
+    Every row is written and flushed as soon as it is appended, so the rows of an interrupted run
+    are kept and reloaded when the store is opened again. Only the rank 0 of the communicator
+    writes to the file.
+    """
+
+    def __init__(self, filename, columns, comm=COMM_WORLD):
+        self.filename = filename
+        self.columns = list(columns)
+        self.comm = comm
+        self.rows = self._read()
+
+    def _read(self):
+        if not os.path.exists(self.filename):
+            return []
+        with open(self.filename, newline="") as results_file:
+            return list(csv.DictReader(results_file))
+
+    def find(self, **values):
+        # Last row matching all the given column values, compared as strings as read from file
+        for row in reversed(self.rows):
+            if all(str(row.get(column)) == str(value) for column, value in values.items()):
+                return row
+        return None
+
+    def append(self, **row):
+        row.setdefault("timestamp", time.strftime("%Y-%m-%dT%H:%M:%S"))
+        unknown_columns = set(row) - set(self.columns)
+        if unknown_columns:
+            raise ValueError("Unknown columns: %s" % ", ".join(sorted(unknown_columns)))
+        self.rows.append(row)
+        if self.comm.rank == 0:
+            dirname = os.path.dirname(self.filename)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            write_header = not os.path.exists(self.filename)
+            with open(self.filename, "a", newline="") as results_file:
+                writer = csv.DictWriter(results_file, fieldnames=self.columns)
+                if write_header:
+                    writer.writeheader()
+                writer.writerow(row)
+                results_file.flush()
+                os.fsync(results_file.fileno())
+        return
+
+
+def parameters_hash(**parameters):
+    """Content hash of the parameters defining a case, used to identify completed cases."""
+    return hashlib.sha1(
+        json.dumps(parameters, sort_keys=True, default=_serialize_parameter).encode()
+    ).hexdigest()
+
+
+def _serialize_parameter(value):
+    # Constants (and UFL expressions of Constants) are hashed through their values
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
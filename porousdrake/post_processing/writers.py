@@ -1,35 +1,235 @@
 from firedrake import *
+import h5py
+import numpy as np
 import os
+import queue
+import threading
 from porousdrake.DPP.convergence.solvers import decompose_exact_solution
 
 
-def write_pvd_mixed_formulations(name, mesh, degree, p1_sol, v1_sol, p2_sol, v2_sol):
-    p_e_1, v_e_1, p_e_2, v_e_2 = decompose_exact_solution(mesh, degree)
-    p_e_1.rename("Exact macro pressure", "label")
-    p_e_2.rename("Exact micro pressure", "label")
-    v_e_1.rename("Exact macro velocity", "label")
-    v_e_2.rename("Exact micro velocity", "label")
-    v1_sol.rename("Macro velocity", "label")
-    p1_sol.rename("Macro pressure", "label")
-    v2_sol.rename("Micro velocity", "label")
-    p2_sol.rename("Micro pressure", "label")
-    os.makedirs("results_%s" % name, exist_ok=True)
-    output_file = File("pvd_results_%s/%s.pvd" % (name, name))
-    output_file.write(p1_sol, v1_sol, p2_sol, v2_sol, p_e_1, v_e_1, p_e_2, v_e_2)
+def write_pvd_mixed_formulations(
+    name, mesh, degree, p1_sol, v1_sol, p2_sol, v2_sol, exact_solution=True, output_format="pvd"
+):
+    _write_solutions(
+        name, mesh, degree, (p1_sol, v1_sol, p2_sol, v2_sol), exact_solution, output_format
+    )
     return
 
 
-def write_pvd_hybrid_formulations(name, mesh, degree, p1_sol, v1_sol, p2_sol, v2_sol):
-    p_e_1, v_e_1, p_e_2, v_e_2 = decompose_exact_solution(mesh, degree)
-    p_e_1.rename("Exact macro pressure", "label")
-    p_e_2.rename("Exact micro pressure", "label")
-    v_e_1.rename("Exact macro velocity", "label")
-    v_e_2.rename("Exact micro velocity", "label")
+def write_pvd_hybrid_formulations(
+    name, mesh, degree, p1_sol, v1_sol, p2_sol, v2_sol, exact_solution=True, output_format="pvd"
+):
+    _write_solutions(
+        name, mesh, degree, (p1_sol, v1_sol, p2_sol, v2_sol), exact_solution, output_format
+    )
+    return
+
+
+def _write_solutions(name, mesh, degree, solutions, exact_solution, output_format):
+    """Write the numerical (and exact, cached per case) fields of a case.
+
+    The "pvd" format interpolates the fields to VTK cells. The "hdf5" format saves the native
+    solution vectors, with the mesh, in a single parallel Firedrake CheckpointFile, which can be
+    loaded back with CheckpointFile.load_function.
+    """
+    p1_sol, v1_sol, p2_sol, v2_sol = solutions
     v1_sol.rename("Macro velocity", "label")
     p1_sol.rename("Macro pressure", "label")
     v2_sol.rename("Micro velocity", "label")
     p2_sol.rename("Micro pressure", "label")
-    os.makedirs("results_%s" % name, exist_ok=True)
-    output_file = File("pvd_results_%s/%s.pvd" % (name, name))
-    output_file.write(p1_sol, v1_sol, p2_sol, v2_sol, p_e_1, v_e_1, p_e_2, v_e_2)
+    fields = [p1_sol, v1_sol, p2_sol, v2_sol]
+    if exact_solution:
+        p_e_1, v_e_1, p_e_2, v_e_2 = decompose_exact_solution(mesh, degree)
+        p_e_1.rename("Exact macro pressure", "label")
+        p_e_2.rename("Exact micro pressure", "label")
+        v_e_1.rename("Exact macro velocity", "label")
+        v_e_2.rename("Exact micro velocity", "label")
+        fields += [p_e_1, v_e_1, p_e_2, v_e_2]
+
+    if output_format == "pvd":
+        os.makedirs("pvd_results_%s" % name, exist_ok=True)
+        output_file = File("pvd_results_%s/%s.pvd" % (name, name))
+        output_file.write(*fields)
+    elif output_format == "hdf5":
+        os.makedirs("hdf5_results_%s" % name, exist_ok=True)
+        with CheckpointFile("hdf5_results_%s/%s.h5" % (name, name), "w") as afile:
+            afile.save_mesh(mesh)
+            for field in fields:
+                afile.save_function(_native_function(field), name=field.name())
+    else:
+        raise ValueError("Unknown output format: %s" % output_format)
+    return
+
+
+def _native_function(field):
+    # Components of a mixed solution are saved as functions on their own (collapsed) space,
+    # sharing the solution data
+    V = field.function_space()
+    if V.index is None:
+        return field
+    return Function(V.collapse(), val=field.dat, name=field.name())
+
+
+class TransientWriter(object):
+    """Decimated output of a transient run, with all the fields of a step written in one file.
+
+    A step is written every write_interval steps and every time_interval of simulated time, when
+    given. With mode="a", the steps are appended to an existing output.
+
+    The steps are written synchronously by default, since Firedrake, PyOP2 and PETSc are not
+    thread-safe. With asynchronous, the owned field values of a step are gathered on rank 0, which
+    appends them to a single HDF5 file (<filename without extension>.h5) from a background thread
+    making no Firedrake or PETSc calls, so the next steps are computed while the previous ones are
+    written. transient_to_vtk converts that file to VTK after the run.
+    """
+
+    def __init__(
+        self,
+        filename,
+        write_interval=1,
+        time_interval=None,
+        asynchronous=False,
+        max_pending=2,
+        mode="w",
+        comm=COMM_WORLD,
+    ):
+        dirname = os.path.dirname(filename)
+        if dirname and comm.rank == 0:
+            os.makedirs(dirname, exist_ok=True)
+        comm.Barrier()
+        self.filename = filename
+        self.comm = comm
+        self.write_interval = write_interval
+        self.time_interval = time_interval
+        self.next_write_time = None
+        self.num_calls = 0
+        self.num_writes = 0
+
+        self.asynchronous = asynchronous
+        self.error = None
+        if self.asynchronous:
+            self.h5_filename = transient_h5_filename(filename)
+            if comm.rank == 0:
+                self.h5_file = h5py.File(self.h5_filename, mode)
+                self.first_index = len(self.h5_file)
+                # Bounded, so the run can not get more than max_pending steps ahead of the writes
+                self.pending = queue.Queue(maxsize=max_pending)
+                self.thread = threading.Thread(target=self._write_pending, daemon=True)
+                self.thread.start()
+        else:
+            self.output_file = File(filename, mode=mode, comm=comm)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def due(self, step, time=None):
+        if step % self.write_interval != 0:
+            return False
+        if self.time_interval is None or time is None:
+            return True
+        return self.next_write_time is None or time >= self.next_write_time - 1e-12 * abs(time)
+
+    def write(self, *fields, time=None, step=None, force=False):
+        """Write the fields of the step, if due. Returns whether they were written.
+
+        Without step, the calls to write are counted as the steps.
+        """
+        self.num_calls += 1
+        if step is None:
+            step = self.num_calls
+        if not (force or self.due(step, time)):
+            return False
+        if self.time_interval is not None and time is not None:
+            self.next_write_time = time + self.time_interval
+        self.num_writes += 1
+
+        if not self.asynchronous:
+            self.output_file.write(*fields, time=time)
+            return True
+
+        # The values are gathered here, so the thread only handles numpy arrays
+        gathered = [self.comm.gather(field.dat.data_ro, root=0) for field in fields]
+        if self.comm.rank != 0:
+            return True
+        snapshot = {
+            "names": [field.name() for field in fields],
+            "time": time,
+            "sizes": [[len(values) for values in field_values] for field_values in gathered],
+            "values": [np.concatenate(field_values) for field_values in gathered],
+        }
+        self.pending.put((self.first_index + self.num_writes - 1, snapshot))
+        return True
+
+    def _write_pending(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                self.pending.task_done()
+                return
+            index, snapshot = item
+            try:
+                if self.error is None:
+                    group = self.h5_file.create_group("step_%06d" % index)
+                    if snapshot["time"] is not None:
+                        group.attrs["time"] = snapshot["time"]
+                    for i, name in enumerate(snapshot["names"]):
+                        dataset = group.create_dataset("field%d" % i, data=snapshot["values"][i])
+                        dataset.attrs["name"] = name
+                        dataset.attrs["sizes"] = snapshot["sizes"][i]
+                    self.h5_file.flush()
+            except Exception as error:
+                self.error = error
+            self.pending.task_done()
+
+    def close(self):
+        """Wait for the pending steps to be written; raises on every rank if a write failed."""
+        if self.asynchronous and self.comm.rank == 0 and self.thread.is_alive():
+            self.pending.put(None)
+            self.thread.join()
+            self.h5_file.close()
+        if self.asynchronous and self.comm.bcast(self.error is not None, root=0):
+            raise RuntimeError("Writing %s failed" % self.h5_filename) from self.error
+
+
+def transient_h5_filename(filename):
+    return "%s.h5" % os.path.splitext(filename)[0]
+
+
+def load_step(h5_file, index, fields, comm=COMM_WORLD):
+    """Copy the step index of an asynchronous TransientWriter output into the fields.
+
+    The fields are given in the order they were written, on the mesh of the run distributed over
+    the same number of ranks. Returns the time of the step, or None when it was not given.
+    """
+    group = h5_file["step_%06d" % index]
+    if len(group) != len(fields):
+        raise ValueError("Step %d holds %d fields, %d given" % (index, len(group), len(fields)))
+    for i, field in enumerate(fields):
+        dataset = group["field%d" % i]
+        sizes = dataset.attrs["sizes"]
+        if len(sizes) != comm.size or sizes[comm.rank] != len(field.dat.data_ro):
+            raise ValueError(
+                "Step %d was written on a different partition than the one of %s"
+                % (index, field.name())
+            )
+        offset = int(np.sum(sizes[: comm.rank]))
+        field.dat.data[:] = dataset[offset : offset + sizes[comm.rank]]
+    if "time" in group.attrs:
+        return float(group.attrs["time"])
+    return None
+
+
+def transient_to_vtk(filename, fields, comm=COMM_WORLD):
+    """Write the steps of an asynchronous TransientWriter output to filename, in VTK format.
+
+    The fields are the ones given to the writer (in the same order), whose values are overwritten.
+    """
+    output_file = File(filename, comm=comm)
+    with h5py.File(transient_h5_filename(filename), "r") as h5_file:
+        for index in range(len(h5_file)):
+            time = load_step(h5_file, index, fields, comm=comm)
+            output_file.write(*fields, time=time)
     return
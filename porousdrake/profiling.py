@@ -0,0 +1,75 @@
+"""
+PETSc logging of the solver phases.
+
+Each phase is measured by the PETSc events logged during it: the porousdrake events below, the
+SNES residual/Jacobian evaluations and the events logged by Firedrake's static condensation
+preconditioner (SCPC). The times are also reported by -log_view, under one stage per solver.
+The phases are only timed once begin has been called, by the solvers asked for a profile.
+
+The kernels are generated by TSFC and compiled by PyOP2 when they are first used: the form kernels
+on the first assembly, and the Slate kernels of the sdhm static condensation on its first setup.
+Their compilation is therefore part of the assembly and static condensation phases of the first
+solve of a case, unless the disk caches are warm (see porousdrake.warmup).
+"""
+
+import os
+from firedrake.petsc import PETSc
+from mpi4py import MPI
+
+phase_events = {
+    "form construction": ["PorousdrakeFormConstruction"],
+    "assembly": ["SNESFunctionEval", "SNESJacobianEval"],
+    "static condensation": ["SCPCInit", "SCPCUpdate", "SCForwardElim"],
+    "condensed solve": ["SCSolve"],
+    "back-substitution": ["SCBackSub"],
+    "error evaluation": ["PorousdrakeErrorEvaluation"],
+}
+
+# Phases of the solver setup and solves; the errors are evaluated afterwards, on request
+solve_phases = [phase for phase in phase_events if phase != "error evaluation"]
+
+_logging = False
+
+
+def begin():
+    """Start the PETSc logging, which the event times require (a no-op after the first call)."""
+    global _logging
+    if not _logging:
+        PETSc.Log.begin()
+        _logging = True
+
+
+def stage(name):
+    return PETSc.Log.Stage(name)
+
+
+def event(phase):
+    return PETSc.Log.Event(phase_events[phase][0])
+
+
+def phase_times(phases=solve_phases):
+    """Time spent so far in each phase, in the current logging stage (zero until begin)."""
+    if not _logging:
+        return dict.fromkeys(phases, 0.0)
+    return {
+        phase: sum(
+            PETSc.Log.Event(event_name).getPerfInfo()["time"] for event_name in phase_events[phase]
+        )
+        for phase in phases
+    }
+
+
+def elapsed_times(start_times):
+    end_times = phase_times(list(start_times))
+    return {phase: end_times[phase] - start_times[phase] for phase in start_times}
+
+
+def resident_memory(comm):
+    """Current resident set size (kB) of the processes, summed over the ranks of comm.
+
+    Read from /proc/self/statm (Linux). Unlike ru_maxrss, the high-water mark of the process since
+    it started, it can be measured before and after a case to get the memory used by the case.
+    """
+    with open("/proc/self/statm") as statm:
+        resident_pages = int(statm.read().split()[1])
+    return comm.allreduce(resident_pages * os.sysconf("SC_PAGE_SIZE") // 1024, op=MPI.SUM)
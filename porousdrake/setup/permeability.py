@@ -0,0 +1,64 @@
+from firedrake import *
+import numpy as np
+
+
+def layered_permeability(mesh, layers_top, values, direction=1):
+    """Piecewise constant permeability of a layered medium, as an UFL expression.
+
+    The i-th value holds where layers_top[i - 1] < x[direction] <= layers_top[i]. Above the
+    last layer top, the last value is kept.
+    """
+    if len(layers_top) != len(values):
+        raise ValueError("One value is required for each layer")
+    x = SpatialCoordinate(mesh)
+    permeability = as_ufl(values[-1])
+    for layer_top, value in zip(reversed(layers_top[:-1]), reversed(values[:-1])):
+        permeability = conditional(le(x[direction], layer_top), value, permeability)
+    return permeability
+
+
+def load_permeability(
+    filename, kSpace, extent, shape=None, dtype="float64", offset=0, order="C", layer=None
+):
+    """Sample a permeability map stored on disk onto the DG0 space kSpace.
+
+    The map is a regular grid covering the box extent = ((x_min, x_max), (y_min, y_max), ...),
+    stored either as a .npy file or as a raw binary file with the given shape and dtype. The file
+    is memory-mapped and only the entries of the cells owned by the current rank are read. When
+    the map has one more dimension than the mesh (e.g. a 3D cube on a 2D mesh), layer selects the
+    index along its last axis.
+    """
+    if str(filename).endswith(".npy"):
+        permeability_map = np.load(filename, mmap_mode="r")
+    else:
+        if shape is None:
+            raise ValueError("The shape of the map is required for raw binary files")
+        permeability_map = np.memmap(
+            filename, dtype=dtype, mode="r", offset=offset, shape=tuple(shape), order=order
+        )
+    if layer is not None:
+        permeability_map = permeability_map[..., layer]
+
+    mesh = kSpace.mesh()
+    dim = mesh.geometric_dimension()
+    if permeability_map.ndim != dim:
+        raise ValueError(
+            "A %dD permeability map can not be sampled on a %dD mesh" % (permeability_map.ndim, dim)
+        )
+
+    # Centroids of the locally owned cells, with the same numbering as the DG0 kSpace
+    centroids = Function(VectorFunctionSpace(mesh, "DG", 0))
+    centroids.interpolate(SpatialCoordinate(mesh))
+    points = centroids.dat.data_ro
+
+    # Grid indices of the map entries containing each centroid
+    indices = []
+    for axis in range(dim):
+        lower, upper = extent[axis]
+        num_entries = permeability_map.shape[axis]
+        index = np.floor((points[:, axis] - lower) / (upper - lower) * num_entries).astype(int)
+        indices.append(np.clip(index, 0, num_entries - 1))
+
+    permeability = Function(kSpace, name="Permeability")
+    permeability.dat.data[:] = permeability_map[tuple(indices)]
+    return permeability
@@ -10,6 +10,221 @@ eta_p = 10 * eta_u
 beta_0 = Constant(1.0e-15)
 mesh_parameter = True
 
+# Solver parameters of the DPP sdhm when the velocities and pressures of both porosities are
+# eliminated together, so a single coupled system is solved for the (lambda1, lambda2) traces
+sdhm_monolithic_solver_parameters = {
+    "snes_type": "ksponly",
+    "mat_type": "matfree",
+    "pmat_type": "matfree",
+    "ksp_type": "preonly",
+    "pc_type": "python",
+    "pc_python_type": "firedrake.SCPC",
+    "pc_sc_eliminate_fields": "0, 1, 2, 3",
+    "condensed_field": {
+        "ksp_type": "preonly",
+        "pc_type": "lu",
+        "pc_factor_mat_solver_type": "mumps",
+    },
+}
+
+
+def sdhm_solver_parameters(preconditioner="lu", monolithic=False):
+    """Solver parameters of the DPP sdhm with a selectable solver for the condensed traces.
+
+    The condensed trace systems are solved with MUMPS ("lu") or by GMRES preconditioned by
+    algebraic multigrid ("gamg" or "hypre"). With monolithic, the velocities and pressures of both
+    porosities are eliminated together, so the exchange coupling is held by the single condensed
+    system of the (lambda1, lambda2) traces. Otherwise the macro (0, 1, 2) and micro (3, 4, 5)
+    blocks are condensed separately and coupled by a full Schur complement factorization: the
+    Schur complement, which holds the exchange coupling, is solved by GMRES preconditioned by the
+    condensed micro block, and the outer Krylov method is flexible. The outer iteration counts over
+    a ladder of meshes are reported by porousdrake.benchmarks.iteration_counts.
+    """
+    if preconditioner == "lu":
+        condensed_field = {
+            "ksp_type": "preonly",
+            "pc_type": "lu",
+            "pc_factor_mat_solver_type": "mumps",
+        }
+    elif preconditioner == "gamg":
+        condensed_field = {
+            "ksp_type": "gmres",
+            "ksp_rtol": 1e-12,
+            "ksp_atol": 1e-12,
+            "pc_type": "gamg",
+            "pc_gamg_sym_graph": True,
+            "mg_levels_ksp_type": "richardson",
+            "mg_levels_pc_type": "sor",
+        }
+    elif preconditioner == "hypre":
+        condensed_field = {
+            "ksp_type": "gmres",
+            "ksp_rtol": 1e-12,
+            "ksp_atol": 1e-12,
+            "pc_type": "hypre",
+            "pc_hypre_type": "boomeramg",
+        }
+    else:
+        raise ValueError("Unknown preconditioner for the condensed traces: %s" % preconditioner)
+
+    if monolithic:
+        return {
+            "snes_type": "ksponly",
+            "mat_type": "matfree",
+            "pmat_type": "matfree",
+            "ksp_type": "preonly",
+            "pc_type": "python",
+            "pc_python_type": "firedrake.SCPC",
+            "pc_sc_eliminate_fields": "0, 1, 2, 3",
+            "condensed_field": condensed_field,
+        }
+
+    porosity_block = {
+        "pmat_type": "matfree",
+        "pc_type": "python",
+        "pc_python_type": "firedrake.SCPC",
+        "pc_sc_eliminate_fields": "0, 1",
+        "condensed_field": condensed_field,
+    }
+    return {
+        "snes_type": "ksponly",
+        "pmat_type": "matfree",
+        "ksp_type": "fgmres",
+        "ksp_monitor_true_residual": None,
+        "ksp_rtol": 1e-12,
+        "ksp_atol": 1e-12,
+        "pc_type": "fieldsplit",
+        "pc_fieldsplit_type": "schur",
+        "pc_fieldsplit_schur_fact_type": "FULL",
+        "pc_fieldsplit_schur_precondition": "a11",
+        "pc_fieldsplit_0_fields": "0,1,2",
+        "pc_fieldsplit_1_fields": "3,4,5",
+        # The inverse of the macro block is applied within the Schur complement
+        "fieldsplit_0": dict(porosity_block, ksp_type="preonly"),
+        "fieldsplit_1": dict(porosity_block, ksp_type="gmres", ksp_rtol=1e-8),
+    }
+
+
+# Default solver parameters of the DPP sdhm velocity patch: the macro (0, 1, 2) and micro (3, 4, 5)
+# blocks are condensed separately, as block preconditioners of a multiplicative fieldsplit
+sdhm_velocity_patch_solver_parameters = {
+    "snes_type": "ksponly",
+    "pmat_type": "matfree",
+    "ksp_type": "tfqmr",
+    "ksp_monitor_true_residual": None,
+    "ksp_rtol": 1e-12,
+    "ksp_atol": 1e-12,
+    "pc_type": "fieldsplit",
+    "pc_fieldsplit_0_fields": "0,1,2",
+    "pc_fieldsplit_1_fields": "3,4,5",
+    "fieldsplit_0": {
+        "pmat_type": "matfree",
+        "ksp_type": "preonly",
+        "pc_type": "python",
+        "pc_python_type": "firedrake.SCPC",
+        "pc_sc_eliminate_fields": "0, 1",
+        "condensed_field": {
+            "ksp_type": "preonly",
+            "pc_type": "lu",
+            "pc_factor_mat_solver_type": "mumps",
+        },
+    },
+    "fieldsplit_1": {
+        "pmat_type": "matfree",
+        "ksp_type": "preonly",
+        "pc_type": "python",
+        "pc_python_type": "firedrake.SCPC",
+        "pc_sc_eliminate_fields": "0, 1",
+        "condensed_field": {
+            "ksp_type": "preonly",
+            "pc_type": "lu",
+            "pc_factor_mat_solver_type": "mumps",
+        },
+    },
+}
+
+# Solver parameters of the SPP sdhm: the velocity and pressure are eliminated, and the condensed
+# trace system is solved with MUMPS
+spp_sdhm_solver_parameters = {
+    "snes_type": "ksponly",
+    "mat_type": "matfree",
+    "pmat_type": "matfree",
+    "ksp_type": "preonly",
+    "pc_type": "python",
+    "pc_python_type": "firedrake.SCPC",
+    "pc_sc_eliminate_fields": "0, 1",
+    "condensed_field": {
+        "ksp_type": "preonly",
+        "pc_type": "lu",
+        "pc_factor_mat_solver_type": "mumps",
+    },
+}
+
+
+def matfree_solver_parameters(preconditioner="block_diagonal"):
+    """Solver parameters of the DPP dgls and cgls with a matrix-free operator.
+
+    Only the action of the operator is computed, so the global four-field matrix is never stored.
+    The preconditioner is assembled from an approximation of the operator: the diagonal blocks of
+    the four fields with ILU ("block_diagonal"), or the degree 1 problem solved with MUMPS as the
+    coarse level of a p-multigrid with matrix-free smoothers ("low_order").
+    """
+    if preconditioner == "block_diagonal":
+        field_block = {
+            "ksp_type": "preonly",
+            "pc_type": "python",
+            "pc_python_type": "firedrake.AssembledPC",
+            "assembled_pc_type": "bjacobi",
+            "assembled_sub_pc_type": "ilu",
+        }
+        preconditioner_parameters = {
+            "pc_type": "fieldsplit",
+            "pc_fieldsplit_type": "additive",
+            "fieldsplit_0": dict(field_block),
+            "fieldsplit_1": dict(field_block),
+            "fieldsplit_2": dict(field_block),
+            "fieldsplit_3": dict(field_block),
+        }
+    elif preconditioner == "low_order":
+        preconditioner_parameters = {
+            "pc_type": "python",
+            "pc_python_type": "firedrake.PMGPC",
+            "pmg_mg_coarse_degree": 1,
+            "pmg_mg_levels": {
+                "ksp_type": "gmres",
+                "ksp_max_it": 3,
+                "ksp_convergence_test": "skip",
+                "pc_type": "jacobi",
+            },
+            "pmg_mg_coarse": {
+                "mat_type": "aij",
+                "ksp_type": "preonly",
+                "pc_type": "lu",
+                "pc_factor_mat_solver_type": "mumps",
+            },
+        }
+    else:
+        raise ValueError("Unknown preconditioner for the matrix-free operator: %s" % preconditioner)
+
+    solver_parameters = {
+        "mat_type": "matfree",
+        "ksp_type": "fgmres",
+        "ksp_gmres_restart": 100,
+        "ksp_rtol": 1e-12,
+        "ksp_atol": 1e-12,
+        "ksp_monitor_true_residual": None,
+    }
+    solver_parameters.update(preconditioner_parameters)
+    return solver_parameters
+
+
+def matfree_form_compiler_parameters(mesh):
+    # On quadrilaterals the spectral mode of TSFC sum-factorizes the operator action
+    if mesh.ufl_cell().cellname() == "quadrilateral":
+        return {"mode": "spectral"}
+    return {}
+
+
 solvers_args = {
     "cgls_full": {
         "delta_0": Constant(1),
@@ -161,3 +376,44 @@ solvers_args = {
         "beta_0": beta_0,
     },
 }
+
+# DPP solver method (sdhm, dgls or cgls) of each entry in solvers_args
+solvers_methods = {
+    "cgls_full": "cgls",
+    "cgls_div": "cgls",
+    "mgls_full": "cgls",
+    "mgls": "cgls",
+    "mvh_full": "cgls",
+    "mvh_div": "cgls",
+    "mvh": "cgls",
+    "dgls_full": "dgls",
+    "dgls_div": "dgls",
+    "dmgls_full": "dgls",
+    "dmgls": "dgls",
+    "dmvh_full": "dgls",
+    "dmvh_div": "dgls",
+    "dmvh": "dgls",
+    "sdhm_full": "sdhm",
+    "sdhm_div": "sdhm",
+    "hmgls_full": "sdhm",
+    "hmgls": "sdhm",
+    "hmvh_full": "sdhm",
+    "hmvh_div": "sdhm",
+    "hmvh": "sdhm",
+}
+
+
+def solver_options(solver_name, preconditioner=None, monolithic=False):
+    """Options of a solver of solvers_args, only the sdhm solvers have some.
+
+    The preconditioner selects the solver of the condensed traces, and monolithic condenses both
+    porosities in one system, see DPPSolver.
+    """
+    options = {}
+    if solvers_methods[solver_name] != "sdhm":
+        return options
+    if preconditioner is not None:
+        options["preconditioner"] = preconditioner
+    if monolithic:
+        options["monolithic"] = True
+    return options
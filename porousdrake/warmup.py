@@ -0,0 +1,142 @@
+"""
+Kernel pre-compilation of the flow solvers.
+
+The first solve of each (study, method, options, degree, cell type, mesh parameter) combination
+pays the TSFC and PyOP2 compilation of its kernels. The warm-up solves each combination once on a
+small mesh, so the kernels are already in the disk caches when the production runs start. The
+caches are shared between runs (and between the nodes of a cluster) through the PYOP2_CACHE_DIR
+and FIREDRAKE_TSFC_KERNEL_CACHE_DIR directories, see porousdrake.__main__.
+
+The studies are the DPP and SPP convergence and velocity patch problems. The combinations are
+distributed among MPI sub-communicators, as the convergence cases are, so they are compiled in
+parallel.
+"""
+
+from firedrake import *
+from firedrake.petsc import PETSc
+from mpi4py import MPI
+import time
+
+from porousdrake.DPP.convergence.scheduler import run_distributed
+from porousdrake.DPP.convergence.solvers import DPPSolver
+from porousdrake.SPP.convergence.solvers import SPPSolver
+import porousdrake.DPP.velocity_patch.solvers as dpp_velocity_patch
+import porousdrake.SPP.velocity_patch.solvers as spp_velocity_patch
+import porousdrake.setup.solvers_parameters as parameters
+
+default_methods = ["sdhm", "sdhm_monolithic", "dgls", "cgls"]
+default_studies = ["dpp_convergence", "dpp_velocity_patch", "spp_convergence", "spp_velocity_patch"]
+
+
+def warmup_tasks(
+    methods=default_methods,
+    degrees=[1, 2, 3, 4],
+    quadrilaterals=[False, True],
+    mesh_parameters=[True, False],
+    studies=default_studies,
+    preconditioner=None,
+    matrix_free=False,
+):
+    """One task per distinct set of kernels.
+
+    The methods are DPP methods or entries of setup.solvers_parameters.solvers_args. The entries
+    of a method only differ in the values of their stabilizing parameters, which are Constants
+    (kernel arguments), so they share their kernels and are compiled once. The DPP sdhm solvers
+    get the options of setup.solvers_parameters.solver_options for the preconditioner, and the
+    DPP dgls and cgls are also compiled matrix-free when asked. The SPP solvers have no options,
+    so only their sdhm, dgls and cgls methods are compiled.
+    """
+    variants = []
+    for study in studies:
+        for method in methods:
+            dpp_method = parameters.solvers_methods.get(method, method)
+            monolithic = dpp_method == "sdhm_monolithic"
+            if monolithic:
+                dpp_method = "sdhm"
+            if study.startswith("spp"):
+                variant = (study, dpp_method, {})
+                if not monolithic and variant not in variants:
+                    variants.append(variant)
+                continue
+            options_list = [{}]
+            if dpp_method == "sdhm":
+                options_list = [parameters.solver_options("sdhm_full", preconditioner, monolithic)]
+            elif matrix_free:
+                options_list.append({"matrix_free": True})
+            for options in options_list:
+                if (study, dpp_method, options) not in variants:
+                    variants.append((study, dpp_method, options))
+
+    tasks = []
+    for study, method, options in variants:
+        for quadrilateral in quadrilaterals:
+            for mesh_parameter in mesh_parameters:
+                for degree in degrees:
+                    tasks.append(
+                        {
+                            "study": study,
+                            "method": method,
+                            "options": options,
+                            "quadrilateral": quadrilateral,
+                            "mesh_parameter": mesh_parameter,
+                            "degree": degree,
+                        }
+                    )
+    return tasks
+
+
+def compile_task(task, numel_xy=4, comm=COMM_WORLD):
+    # Solving (and evaluating the errors) also compiles the kernels built on the first solve, such
+    # as the static condensation ones
+    mesh = UnitSquareMesh(numel_xy, numel_xy, quadrilateral=task["quadrilateral"], comm=comm)
+    study, method, degree = task["study"], task["method"], task["degree"]
+    kwargs = dict(task["options"], mesh_parameter=task["mesh_parameter"])
+    start = time.time()
+    if study == "dpp_convergence":
+        if kwargs.pop("monolithic", False):
+            method = "sdhm_monolithic"
+        dpp_solver = DPPSolver(method, mesh, degree, **kwargs)
+        dpp_solver.solve()
+        dpp_solver.compute_errors()
+    elif study == "spp_convergence":
+        spp_solver = SPPSolver(method, mesh, degree, **kwargs)
+        spp_solver.solve()
+        spp_solver.compute_errors()
+    elif study == "dpp_velocity_patch":
+        getattr(dpp_velocity_patch, method)(mesh, degree, **kwargs)
+    elif study == "spp_velocity_patch":
+        getattr(spp_velocity_patch, method)(mesh, degree, **kwargs)
+    else:
+        raise ValueError("Unknown study: %s" % study)
+    return comm.allreduce(time.time() - start, op=MPI.MAX)
+
+
+def run_warmup(tasks, numel_xy=4, num_groups=None, comm=COMM_WORLD):
+    start = time.time()
+    run_distributed(
+        lambda task, subcomm: _compile_and_report(task, numel_xy, subcomm),
+        tasks,
+        num_groups=num_groups,
+        comm=comm,
+    )
+    PETSc.Sys.Print(
+        "Warm-up of %d kernel sets done in %.2f s" % (len(tasks), time.time() - start), comm=comm
+    )
+    return
+
+
+def _compile_and_report(task, numel_xy, comm):
+    elapsed = compile_task(task, numel_xy=numel_xy, comm=comm)
+    PETSc.Sys.Print(
+        "Compiled %s %s %s, degree %d, %s, mesh parameter %s: %.2f s"
+        % (
+            task["study"],
+            task["method"],
+            task["options"],
+            task["degree"],
+            "quadrilaterals" if task["quadrilateral"] else "triangles",
+            task["mesh_parameter"],
+            elapsed,
+        ),
+        comm=comm,
+    )